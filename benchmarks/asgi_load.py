@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Load test for the async market-data path.
+
+fetch mode (in-process, no server needed) prices --tickers symbols through a
+SlowProvider that sleeps --delay seconds per call, once with the sync fetch_many
+and once with afetch_many, to show the effect of bounded concurrency:
+
+    python benchmarks/asgi_load.py fetch --tickers 50 --delay 0.5 --concurrency 16
+
+http mode fires --requests GETs, --concurrency at a time, at a running server.
+To compare deployments, start the app with
+FINANCEAPP_PRICE_PROVIDER = 'financeapp.providers.SlowProvider' in settings,
+once under an ASGI server (uvicorn financeproj.asgi:application) and once under
+a sync WSGI worker, then point this at /portfolio/live/ with a logged-in
+session cookie:
+
+    python benchmarks/asgi_load.py http http://127.0.0.1:8000/portfolio/live/ --cookie sessionid=... --requests 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    pick = lambda p: latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+    return {'p50': pick(50), 'p95': pick(95), 'p99': pick(99), 'mean': statistics.fmean(latencies)}
+
+
+def report(label, elapsed, latencies, failures=0):
+    stats = percentiles(latencies) if latencies else {}
+    line = f"{label:>8}: {elapsed:7.2f}s total"
+    if stats:
+        line += f", {len(latencies) / elapsed:7.1f} req/s, " + ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in stats.items())
+    if failures:
+        line += f", {failures} failed"
+    print(line)
+
+
+def run_fetch(args):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'financeproj.settings')
+    import django
+    django.setup()
+    from financeapp.providers import SlowProvider
+
+    provider = SlowProvider(delay=args.delay, max_workers=1)
+    tickers = [f'T{i:04d}' for i in range(args.tickers)]
+
+    start = time.perf_counter()
+    provider.fetch_many(tickers)
+    report('sync', time.perf_counter() - start, [])
+
+    start = time.perf_counter()
+    asyncio.run(provider.afetch_many(tickers, concurrency=args.concurrency, timeout=args.timeout))
+    report('async', time.perf_counter() - start, [])
+
+
+async def run_http(args):
+    import httpx
+
+    cookies = dict(c.split('=', 1) for c in args.cookie)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, failures = [], 0
+
+    async with httpx.AsyncClient(cookies=cookies, timeout=args.timeout, follow_redirects=False) as client:
+        async def one():
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(args.url)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    failures += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        report('http', time.perf_counter() - start, latencies, failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    modes = parser.add_subparsers(dest='mode', required=True)
+
+    fetch = modes.add_parser('fetch', help="Compare sync and async quote fetching against a slow stub provider")
+    fetch.add_argument('--tickers', type=int, default=50)
+    fetch.add_argument('--delay', type=float, default=0.5, help="Seconds the stub provider takes per call")
+    fetch.add_argument('--concurrency', type=int, default=16)
+    fetch.add_argument('--timeout', type=float, help="Give up on the async fetch after this many seconds")
+
+    http = modes.add_parser('http', help="Concurrent GETs against a running server")
+    http.add_argument('url')
+    http.add_argument('--cookie', action='append', default=[], help="name=value, e.g. sessionid=...")
+    http.add_argument('--requests', type=int, default=100)
+    http.add_argument('--concurrency', type=int, default=20)
+    http.add_argument('--timeout', type=float, default=30)
+
+    args = parser.parse_args()
+    if args.mode == 'fetch':
+        run_fetch(args)
+    else:
+        asyncio.run(run_http(args))
+
+
+if __name__ == '__main__':
+    main()
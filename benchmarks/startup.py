@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Cold-start benchmark: how long `manage.py check` spends importing modules and
+how much memory a worker holds after loading the URLconf (i.e. every view
+module), measured in fresh interpreters.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --max-import-ms 800 --max-rss-mb 90
+
+Exits non-zero if a budget is exceeded or any of the --forbid modules get
+imported at startup, so it can run in CI.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ['pandas', 'numpy', 'yfinance', 'mstarpy', 'pyarrow', 'scipy']
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+# Loads Django plus every view module, the way a worker does before its first request.
+WORKER_SCRIPT = """
+import os, resource, sys, django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'financeproj.settings')
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(rss_kb // 1024 if sys.platform == 'darwin' else rss_kb)
+"""
+
+
+def import_times(settings=None):
+    """
+    Run `python -X importtime manage.py check` and return the cumulative import
+    microseconds of each top-level import, plus the names of every module loaded.
+    """
+    command = [sys.executable, '-X', 'importtime', 'manage.py', 'check']
+    if settings:
+        command.append(f'--settings={settings}')
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True)
+
+    top_level, loaded = {}, set()
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        loaded.add(match.group(4))
+        if len(match.group(3)) == 1:  # depth 0: imported directly, not as a dependency
+            top_level[match.group(4)] = int(match.group(2))
+    return top_level, loaded
+
+
+def worker_rss_kb(settings=None):
+    env = dict(os.environ)
+    if settings:
+        env['DJANGO_SETTINGS_MODULE'] = settings
+    result = subprocess.run([sys.executable, '-c', WORKER_SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return int(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--settings', help="Django settings module (default: financeproj.settings)")
+    parser.add_argument('--max-import-ms', type=float, help="Fail if total import time exceeds this")
+    parser.add_argument('--max-rss-mb', type=float, help="Fail if worker RSS after loading views exceeds this")
+    parser.add_argument('--forbid', nargs='*', default=HEAVY_MODULES, help="Modules that must not be imported at startup")
+    parser.add_argument('--top', type=int, default=15, help="How many of the slowest imports to list")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    modules, loaded = import_times(args.settings)
+    total_ms = sum(modules.values()) / 1000
+    rss_mb = worker_rss_kb(args.settings) / 1024
+    loaded_heavy = sorted(m for m in args.forbid if m in loaded)
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    if args.json:
+        print(json.dumps({
+            'import_ms': round(total_ms, 1),
+            'worker_rss_mb': round(rss_mb, 1),
+            'heavy_modules_loaded': loaded_heavy,
+            'slowest': {name: round(us / 1000, 1) for name, us in slowest},
+        }, indent=2))
+    else:
+        print(f"Total import time: {total_ms:.1f} ms")
+        print(f"Worker RSS after loading views: {rss_mb:.1f} MB")
+        print(f"Heavy modules imported at startup: {', '.join(loaded_heavy) or 'none'}")
+        print("Slowest top-level imports:")
+        for name, us in slowest:
+            print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if loaded_heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(loaded_heavy)}")
+    if args.max_import_ms is not None and total_ms > args.max_import_ms:
+        failures.append(f"import time {total_ms:.1f} ms > {args.max_import_ms} ms")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f"worker RSS {rss_mb:.1f} MB > {args.max_rss_mb} MB")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
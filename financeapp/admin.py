@@ -6,6 +6,8 @@ from .models import *
 admin.site.register(Portfolio)
 admin.site.register(Holding)
 admin.site.register(Fund)
+admin.site.register(FundPrice)
 admin.site.register(SectorAllocation)
 admin.site.register(RegionAllocation)
-admin.site.register(BudgetItem)
\ No newline at end of file
+admin.site.register(BudgetItem)
+admin.site.register(PortfolioSnapshot)
\ No newline at end of file
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import record_cache
+from .models import CAP_ATTRS, Fund
+from .resilience import lookup_fund
+from .versions import bump_benchmarks
+
+DEFAULT_BENCHMARKS = {'total': 'VT', 'international': 'VXUS'}
+DEFAULT_TTL = 60 * 60 * 24
+IDS_KEY = 'financeapp:benchmark:ids'
+
+
+def benchmark_tickers():
+    """Benchmark role -> ticker, overridable with settings.FINANCEAPP_BENCHMARKS."""
+    return getattr(settings, 'FINANCEAPP_BENCHMARKS', DEFAULT_BENCHMARKS)
+
+
+def _key(ticker):
+    return f'financeapp:benchmark:{ticker.upper()}'
+
+
+def _breakdown(fund):
+    return {
+        'regions': {r.region: r.percentage for r in fund.region_allocations.all()},
+        'sectors': {s.sector: s.percentage for s in fund.sector_allocations.all()},
+        'caps': [getattr(fund, attr) for attr in CAP_ATTRS],
+    }
+
+
+def get_benchmarks(tickers):
+    """
+    Region, sector and cap-style breakdowns for each ticker, served from the cache
+    when warm. Misses are loaded in one prefetched query (fetching funds we've
+    never seen through getFund) and cached for settings.FINANCEAPP_BENCHMARK_TTL.
+    """
+    tickers = [t.upper() for t in tickers]
+    cached = cache.get_many([_key(t) for t in tickers])
+    breakdowns = {t: cached[_key(t)] for t in tickers if _key(t) in cached}
+
+    missing = [t for t in tickers if t not in breakdowns]
+    record_cache('benchmark', hits=len(breakdowns), misses=len(missing))
+    if missing:
+        funds = {f.ticker: f for f in Fund.objects.filter(ticker__in=missing).prefetch_related('region_allocations', 'sector_allocations')}
+        for t in missing:
+            if t not in funds:
+                funds[t] = lookup_fund(t)
+        fresh = {t: _breakdown(funds[t]) for t in missing}
+        cache.set_many({_key(t): b for t, b in fresh.items()}, timeout=getattr(settings, 'FINANCEAPP_BENCHMARK_TTL', DEFAULT_TTL))
+        breakdowns.update(fresh)
+    return breakdowns
+
+
+def invalidate_benchmark(ticker):
+    if ticker.upper() in {t.upper() for t in benchmark_tickers().values()}:
+        cache.delete(_key(ticker))
+        bump_benchmarks()
+        ids = cache.get(IDS_KEY)
+        if ids is not None and ticker.upper() not in ids.values():
+            # A benchmark fund saved for the first time: map the ids again
+            cache.delete(IDS_KEY)
+
+
+def _benchmark_ids():
+    """{fund id: ticker} for the benchmark funds in the database, cached like their breakdowns."""
+    ids = cache.get(IDS_KEY)
+    if ids is None:
+        ids = dict(Fund.objects.filter(ticker__in=[t.upper() for t in benchmark_tickers().values()]).values_list('id', 'ticker'))
+        cache.set(IDS_KEY, ids, timeout=getattr(settings, 'FINANCEAPP_BENCHMARK_TTL', DEFAULT_TTL))
+    return ids
+
+
+def invalidate_benchmark_funds(fund_ids):
+    """invalidate_benchmark by fund id, for callers that only have ids (no ticker lookups per row)."""
+    for fund_id, ticker in _benchmark_ids().items():
+        if fund_id in fund_ids:
+            invalidate_benchmark(ticker)
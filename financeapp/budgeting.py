@@ -0,0 +1,60 @@
+import calendar
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.functions import ExtractMonth
+
+from .metrics import instrument
+from .models import BudgetItem
+
+
+def year_range(year):
+    """Half-open date bounds for a year, so filters can use the (user, date) index."""
+    return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+
+
+@instrument('year_budget')
+def year_budget(user, year, income):
+    """
+    Everything the budget page shows for one year: each month's expense rows and
+    need/want/savings totals, per-subcategory monthly averages and average savings.
+    Runs two queries however many months or items there are: the item rows for
+    the tables and the (month, category, subcategory) totals, aggregated in SQL.
+    """
+    start, end = year_range(year)
+    items = BudgetItem.objects.filter(user=user, date__gte=start, date__lt=end)
+    rows = items.order_by('date', 'pk').values('pk', 'date', 'item', 'category', 'subcategory', 'amount')
+    totals = (
+        items.annotate(month=ExtractMonth('date'))
+        .values('month', 'category', 'subcategory')
+        .annotate(total=Sum('amount'))
+        .order_by('month', 'category', 'subcategory')
+    )
+
+    months = {}
+    for row in rows:
+        month = months.setdefault(row['date'].month, {'expenses': [], 'total_needs': Decimal(0), 'total_wants': Decimal(0)})
+        month['expenses'].append({'pk': row['pk'], 'Item': row['item'], 'Category': row['category'], 'Subcategory': row['subcategory'], 'Amount': row['amount']})
+
+    subcategories = {'Need': defaultdict(Decimal), 'Want': defaultdict(Decimal)}
+    for total in totals:
+        months[total['month']]['total_needs' if total['category'] == 'Need' else 'total_wants'] += total['total']
+        subcategories[total['category']][total['subcategory']] += total['total']
+
+    for month in months.values():
+        month['total_spent'] = round(month['total_needs'] + month['total_wants'], 2)
+        month['total_needs'] = round(month['total_needs'], 2)
+        month['total_wants'] = round(month['total_wants'], 2)
+        month['savings'] = round(income - month['total_spent'], 2)
+
+    def averages(category):
+        return [{'subcategory': s, 'average': round(t/len(months), 2)} for s, t in sorted(subcategories[category].items())]
+
+    return {
+        'months': {calendar.month_name[m]: months[m] for m in sorted(months)},
+        'needs_summary': averages('Need'),
+        'wants_summary': averages('Want'),
+        'savings': round(sum(m['savings'] for m in months.values())/len(months) if months else 0, 2),
+    }
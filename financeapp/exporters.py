@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from .models import BudgetItem, Holding
+
+CHUNK_SIZE = 2000
+
+# kind -> (model, exported fields, filter for a single user)
+EXPORTS = {
+    'budget': (BudgetItem, ['id', 'user__username', 'date', 'item', 'category', 'subcategory', 'amount'], 'user'),
+    'holdings': (Holding, ['id', 'portfolio__user__username', 'fund__ticker', 'fund__name', 'shares', 'fund__nav', 'fund__last_updated'], 'portfolio__user'),
+}
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def export_rows(kind, user=None):
+    """Column names and a chunked iterator over the export's rows, never materializing the queryset."""
+    model, fields, user_filter = EXPORTS[kind]
+    queryset = model.objects.order_by('pk')
+    if user is not None:
+        queryset = queryset.filter(**{user_filter: user})
+    return fields, queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object whose write() hands the line back, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(fields, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_stream(fields, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink that keeps track of its position but lets written bytes be taken out as they arrive."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_type(model, lookup):
+    import pyarrow as pa
+
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    field = model._meta.get_field(name)
+    if isinstance(field, models.DecimalField):
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.DateField):
+        return pa.date32()
+    if isinstance(field, (models.AutoField, models.BigAutoField, models.IntegerField)):
+        return pa.int64()
+    return pa.string()
+
+
+def parquet_stream(kind, fields, rows):
+    """Parquet file written one row group per chunk, yielding bytes as each row group is flushed."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    model = EXPORTS[kind][0]
+    schema = pa.schema([(f, _arrow_type(model, f)) for f in fields])
+    sink = _Drain()
+    with pq.ParquetWriter(sink, schema) as writer:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == CHUNK_SIZE:
+                writer.write_table(pa.Table.from_pylist([dict(zip(fields, r)) for r in chunk], schema=schema))
+                chunk = []
+                yield sink.drain()
+        if chunk:
+            writer.write_table(pa.Table.from_pylist([dict(zip(fields, r)) for r in chunk], schema=schema))
+    yield sink.drain()
+
+
+def export_stream(kind, file_format, user=None):
+    """Generator of str (CSV/JSON lines) or bytes (Parquet) chunks for the export."""
+    fields, rows = export_rows(kind, user)
+    if file_format == 'csv':
+        return csv_stream(fields, rows)
+    if file_format == 'jsonl':
+        return jsonl_stream(fields, rows)
+    return parquet_stream(kind, fields, rows)
@@ -0,0 +1,96 @@
+from decimal import Decimal
+
+import numpy as np
+
+from .models import CAP_ATTRS
+
+
+def _allocation_matrix(funds, relation, label_attr):
+    """One row per fund, one column per region/sector label (in first-seen order)."""
+    labels, rows, cols, pcts = {}, [], [], []
+    for i, fund in enumerate(funds):
+        for allocation in getattr(fund, relation).all():
+            label = getattr(allocation, label_attr)
+            rows.append(i)
+            cols.append(labels.setdefault(label, len(labels)))
+            pcts.append(float(allocation.percentage))
+    matrix = np.zeros((len(funds), len(labels)))
+    matrix[rows, cols] = pcts
+    return matrix, list(labels)
+
+
+class FundMatrix:
+    """Region, sector and cap-style allocations (in percent) for a list of funds, one row per fund."""
+
+    def __init__(self, funds):
+        self.funds = list(funds)
+        self.navs = np.array([float(fund.nav or 0) for fund in self.funds])
+        self.regions, self.region_labels = _allocation_matrix(self.funds, 'region_allocations', 'region')
+        self.sectors, self.sector_labels = _allocation_matrix(self.funds, 'sector_allocations', 'sector')
+        self.caps = np.array([[float(getattr(fund, attr)) for attr in CAP_ATTRS] for fund in self.funds]).reshape(len(self.funds), len(CAP_ATTRS))
+
+    def exposures(self, shares):
+        """
+        Dollar-weighted exposures for ``shares``, an array of share counts with one
+        entry per fund, or a 2-D array with one row per portfolio.
+        """
+        values = np.asarray(shares, dtype=float) * self.navs
+        totals = values.sum(axis=-1, keepdims=True)
+        weights = np.divide(values, totals, out=np.zeros_like(values), where=totals > 0)
+        return {
+            'values': values,
+            'total': totals[..., 0],
+            'regions': weights @ self.regions,
+            'sectors': weights @ self.sectors,
+            'caps': weights @ self.caps,
+        }
+
+
+def _percentages(labels, row):
+    return {label: round(Decimal(float(p)), 2) for label, p in zip(labels, row)}
+
+
+def cap_label(attr):
+    return attr.replace('_', ' ').replace('cap ', '').title()
+
+
+def holding_exposures(holdings):
+    """
+    Region, international, cap-style and sector exposures (percent of portfolio
+    value) for a portfolio's holdings, keyed the way the portfolio page shows them.
+    """
+    holdings = list(holdings)
+    if not holdings:
+        return {'regions': {}, 'intl_regions': {}, 'allocs': {}, 'sectors': {}}
+
+    matrix = FundMatrix(holding.fund for holding in holdings)
+    result = matrix.exposures([float(holding.shares) for holding in holdings])
+
+    regions = _percentages(matrix.region_labels, result['regions'])
+    domestic = regions.get('United States', 0)
+    intl_regions = {r: round(p/(100-domestic)*100, 2) for r, p in regions.items() if r != 'United States'} if domestic != 100 else {}
+    return {
+        'regions': regions,
+        'intl_regions': intl_regions,
+        'allocs': _percentages([cap_label(attr) for attr in CAP_ATTRS], result['caps']),
+        'sectors': _percentages(matrix.sector_labels, result['sectors']),
+    }
+
+
+def exposures_by_portfolio(holdings):
+    """
+    Raw exposure arrays for every portfolio in ``holdings`` at once, for batch jobs.
+    Returns the FundMatrix, the portfolio ids (row order) and the exposures dict.
+    """
+    holdings = list(holdings)
+    funds = {holding.fund_id: holding.fund for holding in holdings}
+    fund_index = {fund_id: i for i, fund_id in enumerate(funds)}
+    portfolio_ids = sorted({holding.portfolio_id for holding in holdings})
+    portfolio_index = {portfolio_id: i for i, portfolio_id in enumerate(portfolio_ids)}
+
+    shares = np.zeros((len(portfolio_ids), len(funds)))
+    for holding in holdings:
+        shares[portfolio_index[holding.portfolio_id], fund_index[holding.fund_id]] += float(holding.shares)
+
+    matrix = FundMatrix(funds.values())
+    return matrix, portfolio_ids, matrix.exposures(shares)
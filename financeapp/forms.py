@@ -8,7 +8,7 @@ class HoldingForm(forms.Form):
         max_length=5,
         min_length=1,
         required=True,
-        widget=forms.TextInput(attrs={'class': 'form-control', 'required': True}),
+        widget=forms.TextInput(attrs={'class': 'form-control', 'required': True, 'list': 'fund-options', 'autocomplete': 'off'}),
     )
     dollars_invested = forms.DecimalField(
         max_digits=15,
@@ -52,4 +52,22 @@ class BudgetForm(forms.ModelForm):
             'subcategory': forms.TextInput(attrs={'class': 'form-control', 'required': True}),
             'amount': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
             # 'month': forms.Select(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+
+class BudgetImportForm(forms.Form):
+    FORMAT_CHOICES = [('', 'Detect from file name'), ('csv', 'CSV'), ('ofx', 'OFX/QFX')]
+    file = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control'}),
+        help_text="CSV with date (YYYY-MM-DD), item, category, subcategory and amount columns, or an OFX/QFX bank statement"
+    )
+    file_format = forms.ChoiceField(
+        choices=FORMAT_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    category = forms.ChoiceField(
+        choices=BudgetItem.CATEGORY_CHOICES,
+        initial='Want',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        help_text="Category for rows that don't specify one (all OFX rows)"
+    )
@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Fund, Holding
+from .resilience import lookup_fund
+from .snapshots import mark_dirty
+from .versions import bump_portfolios
+
+
+def _add(portfolio, fund, shares):
+    # Increment in SQL so concurrent purchases of the same fund can't overwrite each other
+    if Holding.objects.filter(portfolio=portfolio, fund=fund).update(shares=F('shares') + shares):
+        return
+    try:
+        with transaction.atomic():
+            Holding.objects.create(portfolio=portfolio, fund=fund, shares=shares)
+    except IntegrityError:
+        # Another request created the holding first (unique on portfolio, fund)
+        Holding.objects.filter(portfolio=portfolio, fund=fund).update(shares=F('shares') + shares)
+
+
+def purchase_shares(fund, shares=None, dollars=None):
+    """Shares bought, given either a share count or a dollar amount at the fund's current NAV."""
+    if shares is not None:
+        if Decimal(shares) <= 0:
+            raise ValueError('Shares must be more than 0')
+        return Decimal(shares)
+    if dollars is None or Decimal(dollars) <= 0:
+        raise ValueError('Dollars invested must be more than 0')
+    if not fund.nav:
+        raise ValueError(f'{fund.ticker} has no NAV yet, enter shares instead of dollars')
+    return round(Decimal(dollars) / Decimal(fund.nav), 4)
+
+
+def add_holding(portfolio, fund, shares):
+    with transaction.atomic():
+        _add(portfolio, fund, shares)
+    # .update() skips post_save, so flag the snapshot and page version here
+    mark_dirty([portfolio.id])
+    bump_portfolios([portfolio.id])
+
+
+@transaction.atomic
+def add_holdings(portfolio, purchases):
+    """
+    Apply many (symbol, shares, dollars) purchases in one transaction: either
+    every holding is updated or, if any symbol can't be resolved, none are.
+    """
+    symbols = {symbol.upper() for symbol, _, _ in purchases}
+    funds = {fund.ticker: fund for fund in Fund.objects.filter(ticker__in=symbols)}
+    for symbol in symbols - funds.keys():
+        funds[symbol] = lookup_fund(symbol)
+    for symbol, shares, dollars in purchases:
+        fund = funds[symbol.upper()]
+        _add(portfolio, fund, purchase_shares(fund, shares, dollars))
+    transaction.on_commit(lambda: mark_dirty([portfolio.id]))
+    bump_portfolios([portfolio.id])
+    return len(purchases)
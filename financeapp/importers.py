@@ -0,0 +1,140 @@
+import csv
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import BudgetItem
+from .versions import BUDGET, bump
+
+CHUNK_SIZE = 2000
+FIELDS = ['date', 'item', 'category', 'subcategory', 'amount']
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)')
+OFX_CREDIT_TYPES = {'CREDIT', 'DEP', 'DIRECTDEP', 'INT', 'DIV'}
+POSITIVE_AMOUNT = re.compile(r'\+?(\d+\.?\d*|\.\d+)')
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    duplicates: int = 0
+    errors: list = field(default_factory=list)  # (row number, message)
+
+
+def read_csv(stream, category='Want', subcategory='Imported'):
+    """
+    Yield rows from a CSV with date (YYYY-MM-DD), item, amount and optional
+    category/subcategory columns. Headers are matched case-insensitively.
+    """
+    for row in csv.DictReader(stream):
+        row = {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+        yield {
+            'date': row.get('date'),
+            'item': row.get('item'),
+            'category': row.get('category') or category,
+            'subcategory': row.get('subcategory') or subcategory,
+            'amount': row.get('amount'),
+        }
+
+
+def read_ofx(stream, category='Want', subcategory='Imported'):
+    """
+    Yield a row per <STMTTRN> in an OFX statement, line by line, so the whole file
+    is never held in memory. Handles both SGML (unclosed tags) and XML OFX.
+    Debits come through as positive amounts; credits (deposits, refunds, interest)
+    aren't expenses and are skipped.
+    """
+    transaction_tags = None
+    for line in stream:
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and transaction_tags is not None:
+                    if not _ofx_credit(transaction_tags):
+                        yield _ofx_row(transaction_tags, category, subcategory)
+                    transaction_tags = None
+                elif not closing:
+                    transaction_tags = {}
+            elif transaction_tags is not None and not closing and value.strip():
+                transaction_tags[tag] = value.strip()
+
+
+def _ofx_credit(tags):
+    # OFX signs amounts from the account's side: debits are negative. A malformed
+    # amount isn't treated as a credit, so validation reports it.
+    return tags.get('TRNTYPE', '').upper() in OFX_CREDIT_TYPES or bool(POSITIVE_AMOUNT.fullmatch(tags.get('TRNAMT', '')))
+
+
+def _ofx_row(tags, category, subcategory):
+    posted = tags.get('DTPOSTED', '')[:8]
+    amount = tags.get('TRNAMT', '')
+    return {
+        'date': f'{posted[:4]}-{posted[4:6]}-{posted[6:8]}' if len(posted) == 8 else posted,
+        'item': tags.get('NAME') or tags.get('MEMO'),
+        'category': category,
+        'subcategory': subcategory,
+        'amount': amount[1:] if amount.startswith('-') else amount,
+    }
+
+
+def clean_row(raw):
+    """Validate a row against the BudgetItem field rules BudgetForm enforces; raises ValidationError."""
+    cleaned = {}
+    for name in FIELDS:
+        value = BudgetItem._meta.get_field(name).clean(raw.get(name) or None, None)
+        cleaned[name] = value
+    cleaned['item'] = cleaned['item'].title()
+    cleaned['subcategory'] = cleaned['subcategory'].title()
+    cleaned['amount'] = cleaned['amount'].quantize(Decimal('0.01'))
+    return cleaned
+
+
+@transaction.atomic
+def import_budget_items(user, rows, chunk_size=CHUNK_SIZE):
+    """
+    Validate and insert ``rows`` for ``user`` in chunks of ``chunk_size`` with
+    bulk_create, all in one transaction. Rows matching an existing (date, item,
+    amount) for the user, or an earlier row of the same import, are skipped.
+    """
+    result = ImportResult()
+    numbered = enumerate(rows, start=1)
+    while chunk := list(islice(numbered, chunk_size)):
+        cleaned = []
+        for number, raw in chunk:
+            try:
+                cleaned.append(clean_row(raw))
+            except ValidationError as e:
+                result.errors.append((number, '; '.join(e.messages)))
+
+        seen = set(
+            BudgetItem.objects
+            .filter(user=user, date__in={r['date'] for r in cleaned}, item__in={r['item'] for r in cleaned})
+            .values_list('date', 'item', 'amount')
+        )
+        new_items = []
+        for row in cleaned:
+            key = (row['date'], row['item'], row['amount'])
+            if key in seen:
+                result.duplicates += 1
+                continue
+            seen.add(key)
+            new_items.append(BudgetItem(user=user, **row))
+        BudgetItem.objects.bulk_create(new_items, batch_size=chunk_size)
+        result.created += len(new_items)
+    if result.created:
+        # bulk_create skips post_save, so bump the budget page's version here
+        bump(BUDGET, [user.id])
+    return result
+
+
+READERS = {'csv': read_csv, 'ofx': read_ofx, 'qfx': read_ofx}
+
+
+def reader_for(filename, file_format=None):
+    file_format = (file_format or filename.rsplit('.', 1)[-1]).lower()
+    if file_format not in READERS:
+        raise ValueError(f"Unsupported import format '{file_format}', expected CSV or OFX.")
+    return READERS[file_format]
@@ -0,0 +1,30 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from financeapp.models import Fund
+from financeapp.performance import ingest_prices
+from financeapp.providers import get_provider
+
+
+class Command(BaseCommand):
+    help = "Load daily NAV history into FundPrice for held funds (or the given tickers)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*')
+        parser.add_argument('--years', type=int, default=5, help="How many years of history to load")
+
+    def handle(self, *args, **options):
+        if options['tickers']:
+            funds = Fund.objects.filter(ticker__in=[t.upper() for t in options['tickers']])
+        else:
+            funds = Fund.objects.filter(holding__isnull=False).distinct()
+        fund_ids = {fund.ticker.upper(): fund.id for fund in funds}
+        start = datetime.date.today() - datetime.timedelta(days=365 * options['years'])
+
+        try:
+            history = get_provider().fetch_history(list(fund_ids), start)
+        except NotImplementedError as e:
+            raise CommandError(e)
+        count = ingest_prices((fund_ids[ticker], date, nav) for ticker, rows in history.items() for date, nav in rows)
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} price(s) for {len(history)} fund(s) since {start}."))
@@ -0,0 +1,160 @@
+import datetime
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from financeapp.snapshots import mark_dirty
+from financeapp.synthetic import make_funds, make_user
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the portfolio and budget pages against a throwaway test database filled with "
+        "synthetic funds, holdings and expenses, priced by the offline provider. Reports latency "
+        "percentiles, query counts and peak memory, warm and cold (every request starting from an "
+        "empty cache and dirty snapshots), and writes them to a JSON baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--funds', type=int, default=10000, help="Size of the fund universe")
+        parser.add_argument('--holdings', type=int, nargs='+', default=[1, 10, 100, 500], help="Holding counts to benchmark (one user each)")
+        parser.add_argument('--budget-years', type=int, default=10)
+        parser.add_argument('--items-per-month', type=int, default=20)
+        parser.add_argument('--iterations', type=int, default=30, help="Timed requests per endpoint")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmarks/baseline.json', help="Where to write the results JSON")
+        parser.add_argument('--compare', help="Baseline JSON to compare against; fails on regressions")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p50 slowdown versus --compare (0.25 = 25%%)")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(FINANCEAPP_PRICE_PROVIDER='financeapp.providers.OfflineProvider'):
+                cache.clear()
+                results = self.run_benchmarks(options)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        report = {'meta': self.meta(options), 'results': results}
+        Path(options['output']).parent.mkdir(parents=True, exist_ok=True)
+        Path(options['output']).write_text(json.dumps(report, indent=2) + '\n')
+        self.stdout.write(f"Wrote {options['output']}")
+
+        if options['compare']:
+            self.compare(results, json.loads(Path(options['compare']).read_text())['results'], options['tolerance'])
+
+    def run_benchmarks(self, options):
+        start = time.perf_counter()
+        funds = make_funds(options['funds'], seed=options['seed'])
+        users = {
+            count: make_user(f'bench{count}', funds, holdings=count, budget_years=options['budget_years'],
+                             items_per_month=options['items_per_month'], seed=options['seed'] + count)
+            for count in options['holdings']
+        }
+        self.stdout.write(f"Generated synthetic data in {time.perf_counter() - start:.1f}s")
+
+        year = datetime.date.today().year
+        results = {}
+        for count, user in users.items():
+            client = Client()
+            client.force_login(user)
+            for name, url in [('portfolio', '/portfolio/'), ('budget', f'/budget/{year}')]:
+                key = f'{name}[holdings={count}]' if name == 'portfolio' else f'{name}[user={count}]'
+                for cold in (False, True):
+                    label = f'{key} cold' if cold else key
+                    results[label] = self.measure(client, url, options['iterations'], [user.portfolio.id], cold)
+                    self.stdout.write(f"{label:>33}: " + ", ".join(f"{k} {v}" for k, v in results[label].items()))
+        return results
+
+    def measure(self, client, url, iterations, portfolio_ids, cold=False):
+        """
+        Warm runs time the steady state, with the fragment cache, benchmark
+        breakdowns and snapshots filled. Cold runs clear the cache and dirty the
+        user's snapshots before every request, as after a deploy or a price refresh.
+        """
+        def prepare():
+            if cold:
+                cache.clear()
+                mark_dirty(portfolio_ids)
+
+        # Sets the CSRF cookie (part of the fragment cache keys) and fills the caches
+        self.get(client, url)
+
+        latencies = []
+        for _ in range(iterations):
+            prepare()
+            start = time.perf_counter()
+            self.get(client, url)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        queries = []
+        prepare()
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            self.get(client, url)
+        prepare()
+        tracemalloc.start()
+        self.get(client, url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'queries': len(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def get(self, client, url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} returned {response.status_code}")
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'options': {k: options[k] for k in ('funds', 'holdings', 'budget_years', 'items_per_month', 'iterations', 'seed')},
+        }
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for key, current in results.items():
+            previous = baseline.get(key)
+            if previous is None:
+                continue
+            change = current['p50_ms'] / previous['p50_ms'] - 1 if previous['p50_ms'] else 0
+            self.stdout.write(f"{key:>33}: p50 {previous['p50_ms']} -> {current['p50_ms']} ms ({change:+.0%}), "
+                              f"queries {previous['queries']} -> {current['queries']}")
+            if change > tolerance:
+                regressions.append(f"{key} p50 {change:+.0%}")
+            if current['queries'] > previous['queries']:
+                regressions.append(f"{key} queries {previous['queries']} -> {current['queries']}")
+        if regressions:
+            raise CommandError("Regressions: " + "; ".join(regressions))
@@ -0,0 +1,32 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from financeapp.exporters import EXPORTS, FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = "Stream BudgetItem or Holding data to CSV, JSON lines or Parquet, for one user or everyone."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument('--format', dest='file_format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--user', help="Only export this username's data")
+        parser.add_argument('--output', help="File to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist as e:
+                raise CommandError(e)
+
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in export_stream(options['kind'], options['file_format'], user):
+                out.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        finally:
+            if options['output']:
+                out.close()
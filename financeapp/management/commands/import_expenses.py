@@ -0,0 +1,38 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from financeapp.importers import CHUNK_SIZE, import_budget_items, reader_for
+from financeapp.models import BudgetItem
+
+
+class Command(BaseCommand):
+    help = "Bulk import BudgetItems for a user from a CSV or OFX file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'ofx', 'qfx'], help="Defaults to the file extension")
+        parser.add_argument('--category', default='Want', choices=[c for c, _ in BudgetItem.CATEGORY_CHOICES], help="Category for rows that don't specify one")
+        parser.add_argument('--subcategory', default='Imported', help="Subcategory for rows that don't specify one")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+            reader = reader_for(options['path'], options['file_format'])
+        except (User.DoesNotExist, ValueError) as e:
+            raise CommandError(e)
+
+        start = time.perf_counter()
+        with open(options['path'], encoding='utf-8-sig', newline='') as f:
+            rows = reader(f, category=options['category'], subcategory=options['subcategory'])
+            result = import_budget_items(user, rows, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - start
+
+        for number, error in result.errors:
+            self.stderr.write(f"Row {number}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.created} item(s), skipped {result.duplicates} duplicate(s) and {len(result.errors)} invalid row(s) in {elapsed:.1f}s."
+        ))
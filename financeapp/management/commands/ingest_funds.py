@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from financeapp.universe import CHUNK_SIZE, ingest_funds, read_funds
+
+
+class Command(BaseCommand):
+    help = "Bulk upsert a fund universe (funds plus sector and region allocations) from a JSON/JSON-lines dump."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Funds per transaction")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        total_funds = total_allocations = 0
+        with open(options['path']) as f:
+            for funds, allocations in ingest_funds(read_funds(f), chunk_size=options['chunk_size']):
+                total_funds += funds
+                total_allocations += allocations
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"{total_funds} funds, {total_allocations} allocations ({total_funds / elapsed:.0f} funds/s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {total_funds} funds and {total_allocations} allocations in {time.perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,25 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from financeapp.rebalance import MAX_TRADES, rebalance_all
+
+
+class Command(BaseCommand):
+    help = "Compute rebalancing trades toward the benchmark allocation for every portfolio, as JSON lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cash', type=float, default=0.0, help="New money each portfolio invests")
+        parser.add_argument('--allow-sell', action='store_true', help="Allow trades that shrink existing positions")
+        parser.add_argument('--max-trades', type=int, default=MAX_TRADES)
+        parser.add_argument('--output', help="File to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        out = open(options['output'], 'w') if options['output'] else sys.stdout
+        try:
+            for portfolio_id, result in rebalance_all(options['cash'], options['allow_sell'], options['max_trades']):
+                out.write(json.dumps({'portfolio': portfolio_id, **result}) + '\n')
+        finally:
+            if options['output']:
+                out.close()
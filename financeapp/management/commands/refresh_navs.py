@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from financeapp.models import Fund
+from financeapp.providers import get_provider
+from financeapp.refresh import last_trading_day, refresh_funds, stale_funds
+from financeapp.snapshots import refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = "Refresh Fund NAVs once per trading day, stalest funds first."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help="Only refresh these tickers (refreshed even if already current)")
+        parser.add_argument('--limit', type=int, help="Refresh at most this many stale funds per pass")
+        parser.add_argument('--loop', action='store_true', help="Keep running, checking for stale funds every --interval seconds")
+        parser.add_argument('--interval', type=int, default=3600, help="Seconds between passes in --loop mode")
+
+    def handle(self, *args, **options):
+        provider = get_provider()
+        while True:
+            self.refresh(provider, options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def refresh(self, provider, options):
+        as_of = last_trading_day()
+        if options['tickers']:
+            funds = Fund.objects.filter(ticker__in=[t.upper() for t in options['tickers']])
+        else:
+            funds = stale_funds(as_of)
+        if options['limit']:
+            funds = funds[:options['limit']]
+
+        refreshed, failed = refresh_funds(provider, funds, as_of)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {len(refreshed)} fund(s) as of {as_of}."))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"No price for: {', '.join(failed)}"))
+        self.stdout.write(f"Recomputed {refresh_snapshots()} portfolio snapshot(s).")
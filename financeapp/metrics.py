@@ -0,0 +1,190 @@
+"""
+Request performance metrics.
+
+Add 'financeapp.metrics.PerformanceMiddleware' to MIDDLEWARE to record, per
+request, the number of queries and DB time, market-data calls and latency,
+cache hits/misses and time spent in analytics and template rendering. Totals
+are exported in Prometheus format at /metrics/.
+
+Settings:
+    FINANCEAPP_METRICS_SAMPLE_RATE  fraction of requests instrumented (default 1.0)
+    FINANCEAPP_SERVER_TIMING        add a Server-Timing header to sampled responses (default False)
+    FINANCEAPP_METRICS_TOKEN        bearer token for /metrics/; without one, only staff can read it
+
+Metrics live in the worker process that recorded them. Under a multi-process
+server (gunicorn or uWSGI workers), set the PROMETHEUS_MULTIPROC_DIR environment
+variable to an empty directory writable by every worker (wiped on each deploy)
+and call prometheus_client.multiprocess.mark_process_dead(worker.pid) from
+gunicorn's child_exit hook. /metrics/ then aggregates all workers; without it,
+each scrape only sees the worker that happened to answer it.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram
+from prometheus_client import multiprocess
+
+REQUEST_SECONDS = Histogram('financeapp_request_seconds', "Request latency", ['view'])
+REQUEST_QUERIES = Histogram('financeapp_request_queries', "Database queries per request", ['view'], buckets=[0, 1, 2, 5, 10, 20, 50, 100, 200, 500])
+REQUEST_DB_SECONDS = Histogram('financeapp_request_db_seconds', "Database time per request", ['view'])
+EXTERNAL_SECONDS = Histogram('financeapp_external_call_seconds', "Market-data call latency", ['operation'])
+COMPUTE_SECONDS = Histogram('financeapp_compute_seconds', "Time in analytics and rendering steps", ['operation'])
+CACHE_REQUESTS = Counter('financeapp_cache_requests', "Cache lookups", ['cache', 'result'])
+
+_current = contextvars.ContextVar('financeapp_request_stats', default=None)
+
+
+def export_registry():
+    """The registry /metrics/ exports: every worker's metrics in multiprocess mode, else this process's."""
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_time: float = 0.0
+    external_calls: int = 0
+    external_time: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    timings: dict = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.queries += 1
+                self.db_time += time.perf_counter() - start
+
+
+def current_stats():
+    """Stats for the request being handled, or None outside a sampled request."""
+    return _current.get()
+
+
+@contextmanager
+def timed(operation, external=False):
+    """
+    Time a block as a market-data call (``external``) or an analytics/render step.
+    The request's breakdown gets the block's own time: queries and timed blocks
+    inside it (the lazily built tables of a render, say) count under their own
+    entries, so the Server-Timing entries add up to the total.
+    """
+    stats = _current.get()
+    if stats is not None:
+        with stats.lock:
+            before = stats.db_time + sum(stats.timings.values())
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        (EXTERNAL_SECONDS if external else COMPUTE_SECONDS).labels(operation).observe(elapsed)
+        if stats is not None:
+            with stats.lock:
+                nested = stats.db_time + sum(stats.timings.values()) - before
+                if external:
+                    stats.external_calls += 1
+                    stats.external_time += elapsed
+                stats.timings[operation] = stats.timings.get(operation, 0) + max(elapsed - nested, 0)
+
+
+def instrument(operation, external=False):
+    """Decorator form of ``timed``."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(operation, external):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache, hits=0, misses=0):
+    if hits:
+        CACHE_REQUESTS.labels(cache, 'hit').inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(cache, 'miss').inc(misses)
+    stats = _current.get()
+    if stats is not None:
+        with stats.lock:
+            stats.cache_hits += hits
+            stats.cache_misses += misses
+
+
+class PerformanceMiddleware:
+    """
+    Instruments a sample of requests. Query counts and DB time come from a
+    connection execute wrapper, so they're only collected for sync views; async
+    views run their queries on other threads' connections.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return random.random() < getattr(settings, 'FINANCEAPP_METRICS_SAMPLE_RATE', 1.0)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        stats, start = RequestStats(), time.perf_counter()
+        token = _current.set(stats)
+        try:
+            with connection.execute_wrapper(stats.record_query):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        stats, start = RequestStats(), time.perf_counter()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    def finish(self, request, response, stats, elapsed):
+        view = request.resolver_match.url_name if request.resolver_match else 'unresolved'
+        REQUEST_SECONDS.labels(view).observe(elapsed)
+        REQUEST_QUERIES.labels(view).observe(stats.queries)
+        REQUEST_DB_SECONDS.labels(view).observe(stats.db_time)
+
+        if getattr(settings, 'FINANCEAPP_SERVER_TIMING', False):
+            entries = [f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"']
+            if stats.external_calls:
+                entries.append(f'market;dur={stats.external_time * 1000:.1f};desc="{stats.external_calls} calls"')
+            if stats.cache_hits or stats.cache_misses:
+                entries.append(f'cache;desc="{stats.cache_hits} hits, {stats.cache_misses} misses"')
+            entries += [f'{name.replace(".", "-")};dur={seconds * 1000:.1f}' for name, seconds in stats.timings.items()]
+            entries.append(f'total;dur={elapsed * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(entries)
+        return response
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:08
+
+import django.core.validators
+import django.db.models.deletion
+import financeapp.models
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Fund',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, help_text="Name of the fund (e.g., 'Vanguard S&P 500 ETF')", max_length=200, null=True)),
+                ('ticker', models.CharField(help_text="Fund ticker symbol (e.g., 'VOO')", max_length=10, unique=True)),
+                ('isin', models.CharField(blank=True, help_text='Fund isin', max_length=20, null=True)),
+                ('nav', models.DecimalField(blank=True, decimal_places=4, help_text='Net Asset Value per share (auto-populated)', max_digits=15, null=True)),
+                ('last_updated', models.DateField(default=financeapp.models.Fund.defaultDate)),
+                ('domestic', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to domestic securities', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('international', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to international securities', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('large_cap_growth', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to large-cap growth', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('large_cap_value', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to large-cap value', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('large_cap_blend', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to large-cap blend', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('mid_cap_growth', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to mid-cap growth', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('mid_cap_value', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to mid-cap value', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('mid_cap_blend', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to mid-cap blend', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('small_cap_growth', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to small-cap growth', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('small_cap_value', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to small-cap value', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('small_cap_blend', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to small-cap blend', max_digits=5, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BudgetItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('item', models.CharField(help_text='Name of the expense', max_length=100)),
+                ('category', models.CharField(choices=[('Need', 'Need'), ('Want', 'Want')], help_text='Category of the expense', max_length=4)),
+                ('subcategory', models.CharField(help_text="Subcategory (e.g., 'food')", max_length=50)),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Amount spent', max_digits=10, validators=[django.core.validators.MinValueValidator(0.0)])),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budget_items', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Portfolio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text="Name of the portfolio (e.g., 'Retirement Fund')", max_length=100)),
+                ('monthly_income', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='portfolio', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Holding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shares', models.DecimalField(decimal_places=4, default=Decimal('0'), help_text='Number of shares held (auto-calculated if not provided)', max_digits=15)),
+                ('fund', models.ForeignKey(help_text='The fund held in this portfolio', on_delete=django.db.models.deletion.CASCADE, to='financeapp.fund')),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holdings', to='financeapp.portfolio')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RegionAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region', models.CharField(help_text="Name of the region (e.g., 'North America', 'Europe')", max_length=100)),
+                ('percentage', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to this region', max_digits=10, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('fund', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='region_allocations', to='financeapp.fund')),
+            ],
+            options={
+                'unique_together': {('fund', 'region')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SectorAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sector', models.CharField(help_text="Name of the sector (e.g., 'Technology', 'Healthcare')", max_length=100)),
+                ('percentage', models.DecimalField(decimal_places=2, default=0.0, help_text='Percentage allocated to this sector', max_digits=10, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('fund', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sector_allocations', to='financeapp.fund')),
+            ],
+            options={
+                'unique_together': {('fund', 'sector')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('regions', models.JSONField(default=list)),
+                ('intl_regions', models.JSONField(default=list)),
+                ('allocs', models.JSONField(default=list)),
+                ('sectors', models.JSONField(default=list)),
+                ('dirty', models.BooleanField(default=True, help_text='Set when holdings or fund data change; cleared on recompute')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('portfolio', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='financeapp.portfolio')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeapp', '0002_portfoliosnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='budgetitem',
+            index=models.Index(fields=['user', 'date', 'item', 'amount'], name='budgetitem_dedupe_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_holdings(apps, schema_editor):
+    """Fold duplicate (portfolio, fund) holdings into one row with the summed shares, ahead of the unique constraint."""
+    Holding = apps.get_model('financeapp', 'Holding')
+    duplicates = (
+        Holding.objects.values('portfolio_id', 'fund_id')
+        .annotate(rows=Count('id'), total=Sum('shares'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        holdings = Holding.objects.filter(portfolio_id=duplicate['portfolio_id'], fund_id=duplicate['fund_id']).order_by('id')
+        keep = holdings.first()
+        holdings.exclude(id=keep.id).delete()
+        keep.shares = duplicate['total']
+        keep.save(update_fields=['shares'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeapp', '0003_budgetitem_dedupe_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_holdings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeapp', '0004_merge_duplicate_holdings'),
+    ]
+
+    operations = [
+        migrations.RenameIndex(
+            model_name='budgetitem',
+            new_name='budgetitem_user_date_idx',
+            old_name='budgetitem_dedupe_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='holding',
+            unique_together={('portfolio', 'fund')},
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeapp', '0005_holding_unique_budgetitem_user_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FundPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('nav', models.DecimalField(decimal_places=4, help_text='Closing NAV per share on this date', max_digits=15)),
+                ('fund', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='financeapp.fund')),
+            ],
+            options={
+                'unique_together': {('fund', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeapp', '0006_fundprice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfoliosnapshot',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text="Bumped with every change, so a recompute that raced one isn't stored as clean"),
+        ),
+    ]
@@ -7,6 +7,13 @@ import datetime
 
 # Create your models here.
 
+# Fund cap-style allocation fields, in display order
+CAP_ATTRS = [
+    'large_cap_growth', 'large_cap_value', 'large_cap_blend',
+    'mid_cap_growth', 'mid_cap_value', 'mid_cap_blend',
+    'small_cap_growth', 'small_cap_value', 'small_cap_blend',
+]
+
 class Portfolio(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='portfolio')
     name = models.CharField(max_length=100, help_text="Name of the portfolio (e.g., 'Retirement Fund')")
@@ -100,6 +107,17 @@ class Fund(models.Model):
                 f"Fund type allocations must sum to approximately 100%"
             )
         
+class FundPrice(models.Model):
+    fund = models.ForeignKey(Fund, on_delete=models.CASCADE, related_name='prices')
+    date = models.DateField()
+    nav = models.DecimalField(max_digits=15, decimal_places=4, help_text="Closing NAV per share on this date")
+
+    class Meta:
+        unique_together = ['fund', 'date']  # One price per fund per day; also the (fund, date) lookup index
+
+    def __str__(self):
+        return f"{self.fund.ticker} {self.date}: {self.nav}"
+
 class SectorAllocation(models.Model):
     fund = models.ForeignKey(Fund, on_delete=models.CASCADE, related_name='sector_allocations')
     sector = models.CharField(
@@ -141,6 +159,9 @@ class Holding(models.Model):
     fund = models.ForeignKey(Fund, on_delete=models.CASCADE, help_text="The fund held in this portfolio")
     shares = models.DecimalField(max_digits=15, decimal_places=4, default=Decimal(0.0), help_text="Number of shares held (auto-calculated if not provided)")
 
+    class Meta:
+        unique_together = ['portfolio', 'fund']  # One holding per fund per portfolio
+
     def __str__(self):
         return f"{self.fund.ticker} in {self.portfolio.name} for {self.portfolio.user.username}"
 
@@ -184,5 +205,31 @@ class BudgetItem(models.Model):
     #     help_text="Month of the expense"
     # )
 
+    class Meta:
+        indexes = [
+            # Leading (user, date) serves the per-user year range filters; the rest covers import duplicate checks
+            models.Index(fields=['user', 'date', 'item', 'amount'], name='budgetitem_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.item}: {self.amount} ({self.category}, {self.date.month}/{self.date.year})"
+
+class PortfolioSnapshot(models.Model):
+    EXPOSURE_FIELDS = ['regions', 'intl_regions', 'allocs', 'sectors']
+
+    portfolio = models.OneToOneField(Portfolio, on_delete=models.CASCADE, related_name='snapshot')
+    total_value = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    # Exposures are stored as ordered [label, percentage] pairs so the page keeps its column order.
+    regions = models.JSONField(default=list)
+    intl_regions = models.JSONField(default=list)
+    allocs = models.JSONField(default=list)
+    sectors = models.JSONField(default=list)
+    dirty = models.BooleanField(default=True, help_text="Set when holdings or fund data change; cleared on recompute")
+    version = models.PositiveIntegerField(default=0, help_text="Bumped with every change, so a recompute that raced one isn't stored as clean")
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def exposures(self):
+        return {field: {label: Decimal(p) for label, p in getattr(self, field)} for field in self.EXPOSURE_FIELDS}
+
     def __str__(self):
-        return f"{self.user.username} {self.item}: {self.amount} ({self.category}, {self.date.month}/{self.date.year})"
\ No newline at end of file
+        return f"Snapshot of {self.portfolio.name} ({self.total_value})"
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import instrument
+from .models import Fund, FundPrice
+
+TRADING_DAYS = 252
+BATCH_SIZE = 1000
+
+STAMP_KEY = 'financeapp:price_series:stamp'
+
+# fund id -> (dates as datetime64[D], navs as float64), loaded once per process
+# and dropped whenever any process publishes a new STAMP_KEY
+_series = {}
+_series_stamp = None
+_series_lock = threading.Lock()
+
+
+def ingest_prices(prices):
+    """
+    Upsert (fund_id, date, nav) rows in batches, overwriting any NAV already
+    stored for that day, and drop the affected funds from the in-process cache.
+    Other workers drop their caches when they see the new stamp.
+    """
+    rows = [FundPrice(fund_id=fund_id, date=date, nav=nav) for fund_id, date, nav in prices]
+    with transaction.atomic():
+        FundPrice.objects.bulk_create(rows, batch_size=BATCH_SIZE, update_conflicts=True, unique_fields=['fund', 'date'], update_fields=['nav'])
+    invalidate_series({row.fund_id for row in rows})
+    return len(rows)
+
+
+def invalidate_series(fund_ids):
+    """Drop ``fund_ids`` here now, and everywhere else once the current transaction commits."""
+    with _series_lock:
+        for fund_id in fund_ids:
+            _series.pop(fund_id, None)
+
+    def publish():
+        global _series_stamp
+        stamp = time.time_ns()
+        previous = cache.get(STAMP_KEY)
+        cache.set(STAMP_KEY, stamp, timeout=None)
+        with _series_lock:
+            for fund_id in fund_ids:
+                _series.pop(fund_id, None)
+            if previous == _series_stamp:
+                # Nothing else changed prices since this process last looked
+                _series_stamp = stamp
+    transaction.on_commit(publish)
+
+
+def _check_stamp():
+    global _series_stamp
+    stamp = cache.get(STAMP_KEY)
+    with _series_lock:
+        if stamp != _series_stamp:
+            _series.clear()
+            _series_stamp = stamp
+
+
+def price_series(fund_ids):
+    """Cached (dates, navs) arrays per fund; funds not in the cache are loaded in one query."""
+    _check_stamp()
+    with _series_lock:
+        missing = [fund_id for fund_id in fund_ids if fund_id not in _series]
+    if missing:
+        loaded = defaultdict(lambda: ([], []))
+        for fund_id, date, nav in FundPrice.objects.filter(fund_id__in=missing).order_by('fund_id', 'date').values_list('fund_id', 'date', 'nav'):
+            dates, navs = loaded[fund_id]
+            dates.append(date)
+            navs.append(float(nav))
+        with _series_lock:
+            for fund_id in missing:
+                dates, navs = loaded.get(fund_id, ([], []))
+                _series[fund_id] = (np.array(dates, dtype='datetime64[D]'), np.array(navs, dtype=float))
+    with _series_lock:
+        return {fund_id: _series[fund_id] for fund_id in fund_ids}
+
+
+def price_matrix(fund_ids, start=None, end=None):
+    """
+    Align the funds' NAVs on the union of their price dates in [start, end],
+    carrying each price forward over days it has no quote. Returns the dates and
+    a (dates x funds) matrix, NaN before a fund's first price.
+    """
+    series = price_series(fund_ids)
+    calendar = np.unique(np.concatenate([dates for dates, _ in series.values()] or [np.array([], dtype='datetime64[D]')]))
+    if start is not None:
+        calendar = calendar[calendar >= np.datetime64(start, 'D')]
+    if end is not None:
+        calendar = calendar[calendar <= np.datetime64(end, 'D')]
+
+    matrix = np.full((len(calendar), len(fund_ids)), np.nan)
+    for column, fund_id in enumerate(fund_ids):
+        dates, navs = series[fund_id]
+        positions = np.searchsorted(dates, calendar, side='right') - 1
+        has_price = positions >= 0
+        matrix[has_price, column] = navs[positions[has_price]]
+    return calendar, matrix
+
+
+def _stats(values, dates):
+    returns = values[1:]/values[:-1] - 1
+    total_return = values[-1]/values[0] - 1
+    years = (dates[-1] - dates[0]).astype(int) / 365.25
+    drawdowns = values/np.maximum.accumulate(values) - 1
+    return {
+        'total_return': float(total_return),
+        'annualized_return': float((1 + total_return) ** (1/years) - 1) if years > 0 else None,
+        'annualized_volatility': float(returns.std(ddof=1) * np.sqrt(TRADING_DAYS)) if len(returns) > 1 else None,
+        'max_drawdown': float(drawdowns.min()),
+    }
+
+
+@instrument('portfolio_performance')
+def portfolio_performance(holdings, start=None, end=None, benchmark='VT'):
+    """
+    Time-weighted return, annualized return and volatility and max drawdown of
+    ``holdings`` (current shares held constant over the period) between ``start``
+    and ``end``, plus the same for ``benchmark`` and the excess return over it.
+    With no cash flows recorded, the time-weighted return is the growth of the
+    portfolio's value. The period starts once every held fund has a price.
+    """
+    holdings = [h for h in holdings if h.shares]
+    if not holdings:
+        return None
+    benchmark_fund = Fund.objects.filter(ticker=benchmark).first()
+    fund_ids = [h.fund_id for h in holdings]
+    columns = fund_ids + ([benchmark_fund.id] if benchmark_fund else [])
+    dates, prices = price_matrix(columns, start, end)
+
+    values = prices[:, :len(fund_ids)] @ np.array([float(h.shares) for h in holdings])
+    priced = ~np.isnan(values)
+    if priced.sum() < 2:
+        return None
+    dates, values, prices = dates[priced], values[priced], prices[priced]
+
+    result = {
+        'start': str(dates[0]),
+        'end': str(dates[-1]),
+        'portfolio': _stats(values, dates),
+        'benchmark': None,
+        'series': {'dates': [str(d) for d in dates], 'growth': (values/values[0]).round(6).tolist()},
+    }
+    if benchmark_fund is not None and not np.isnan(prices[:, -1]).any():
+        result['benchmark'] = {'ticker': benchmark, **_stats(prices[:, -1], dates)}
+        result['excess_return'] = result['portfolio']['total_return'] - result['benchmark']['total_return']
+    return result
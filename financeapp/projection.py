@@ -0,0 +1,141 @@
+import datetime
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from .budgeting import year_budget
+from .metrics import instrument
+
+ASSET_CLASSES = ['US Large', 'US Small/Mid', 'International Large', 'International Small/Mid', 'Bonds/Cash']
+# Nominal annual (mean return, volatility) per asset class, overridable with
+# settings.FINANCEAPP_PROJECTION_ASSUMPTIONS
+DEFAULT_ASSUMPTIONS = {
+    'US Large': (0.07, 0.16),
+    'US Small/Mid': (0.08, 0.20),
+    'International Large': (0.065, 0.17),
+    'International Small/Mid': (0.075, 0.21),
+    'Bonds/Cash': (0.04, 0.06),
+}
+DEFAULT_CORRELATIONS = np.array([
+    [1.00, 0.90, 0.80, 0.75, 0.10],
+    [0.90, 1.00, 0.75, 0.80, 0.10],
+    [0.80, 0.75, 1.00, 0.90, 0.10],
+    [0.75, 0.80, 0.90, 1.00, 0.10],
+    [0.10, 0.10, 0.10, 0.10, 1.00],
+])
+PERCENTILES = [5, 25, 50, 75, 95]
+# Paths per RNG stream; fixed so results for a seed don't depend on the worker count
+SHARD_PATHS = 10_000
+MAX_PATHS = 100_000
+MAX_YEARS = 60
+
+
+def asset_mix(holdings):
+    """
+    Portfolio weight per asset class from each fund's domestic/international
+    split and cap-style box; whatever isn't equity counts as bonds/cash.
+    """
+    values, mixes = [], []
+    for holding in holdings:
+        fund = holding.fund
+        values.append(float(holding.shares * (fund.nav or 0)))
+        domestic, international = float(fund.domestic) / 100, float(fund.international) / 100
+        equity = domestic + international
+        if equity > 1:
+            domestic, international = domestic / equity, international / equity
+        large = float(fund.large_cap_growth + fund.large_cap_value + fund.large_cap_blend)
+        small_mid = float(fund.mid_cap_growth + fund.mid_cap_value + fund.mid_cap_blend + fund.small_cap_growth + fund.small_cap_value + fund.small_cap_blend)
+        # Funds without a style box are treated as large cap
+        large_share = large / (large + small_mid) if large + small_mid else 1.0
+        mixes.append([domestic * large_share, domestic * (1 - large_share), international * large_share,
+                      international * (1 - large_share), max(0.0, 1 - domestic - international)])
+    values = np.array(values)
+    if not values.sum():
+        return np.zeros(len(ASSET_CLASSES)), 0.0
+    return values @ np.array(mixes) / values.sum(), float(values.sum())
+
+
+def _monthly_parameters(weights):
+    """
+    Monthly log-return drift and volatility of a portfolio holding ``weights`` of
+    each asset class. A constant-mix portfolio of correlated lognormal assets,
+    rebalanced continuously, is itself lognormal with rate w·a and variance
+    wᵀΣw, so each path needs one normal draw a month rather than one per class.
+    """
+    assumptions = {**DEFAULT_ASSUMPTIONS, **getattr(settings, 'FINANCEAPP_PROJECTION_ASSUMPTIONS', {})}
+    mean, vol = np.array([assumptions[c] for c in ASSET_CLASSES]).T
+    variance = weights @ (DEFAULT_CORRELATIONS * np.outer(vol, vol)) @ weights
+    return (weights @ np.log1p(mean) - variance / 2) / 12, np.sqrt(variance / 12)
+
+
+def _simulate(seed, paths, years, start, contribution, drift, vol):
+    """
+    Year-end portfolio values (paths x years+1) for one RNG stream. All paths
+    step forward together a month at a time, adding ``contribution`` at the end
+    of each month.
+    """
+    rng = np.random.default_rng(seed)
+    values = np.full(paths, start)
+    yearly = np.empty((paths, years + 1))
+    yearly[:, 0] = values
+    for month in range(1, years * 12 + 1):
+        values *= np.exp(drift + vol * rng.standard_normal(paths))
+        values += contribution
+        np.maximum(values, 0, out=values)
+        if month % 12 == 0:
+            yearly[:, month // 12] = values
+    return yearly
+
+
+@instrument('projection')
+def project(holdings, monthly_contribution, years=30, paths=10_000, seed=None, goal=None, workers=None):
+    """
+    Monte Carlo projection of the portfolio's value over ``years``: percentile
+    bands at each year end across ``paths`` simulated market paths. ``seed``
+    makes a run reproducible (the seed used is returned); ``workers`` > 1 runs
+    the RNG shards in a process pool (settings.FINANCEAPP_PROJECTION_WORKERS).
+    """
+    weights, start = asset_mix(holdings)
+    if not start and not monthly_contribution:
+        return None
+    if not weights.any():
+        weights = np.eye(len(ASSET_CLASSES))[0]
+    drift, vol = _monthly_parameters(weights)
+
+    seed_sequence = np.random.SeedSequence(seed)
+    shards = math.ceil(paths / SHARD_PATHS)
+    sizes = [SHARD_PATHS] * (shards - 1) + [paths - SHARD_PATHS * (shards - 1)]
+    args = [(child, size, years, start, float(monthly_contribution), drift, vol)
+            for child, size in zip(seed_sequence.spawn(shards), sizes)]
+    workers = workers or getattr(settings, 'FINANCEAPP_PROJECTION_WORKERS', 1)
+    if workers > 1 and shards > 1:
+        with ProcessPoolExecutor(min(workers, shards)) as pool:
+            yearly = list(pool.map(_simulate, *zip(*args)))
+    else:
+        yearly = [_simulate(*a) for a in args]
+    yearly = np.vstack(yearly)
+
+    bands = np.percentile(yearly, PERCENTILES, axis=0)
+    this_year = datetime.date.today().year
+    return {
+        'years': list(range(this_year, this_year + years + 1)),
+        'percentiles': {str(p): [round(v, 2) for v in band.tolist()] for p, band in zip(PERCENTILES, bands)},
+        'allocation': {c: round(float(w) * 100, 2) for c, w in zip(ASSET_CLASSES, weights)},
+        'start_value': round(start, 2),
+        'monthly_contribution': round(float(monthly_contribution), 2),
+        'paths': paths,
+        'seed': seed_sequence.entropy,
+        'goal_probability': float((yearly[:, -1] >= goal).mean()) if goal is not None else None,
+    }
+
+
+def monthly_savings(portfolio):
+    """Average monthly savings from this year's budget, or last year's if nothing is entered yet."""
+    this_year = datetime.date.today().year
+    for year in (this_year, this_year - 1):
+        summary = year_budget(portfolio.user, year, portfolio.monthly_income)
+        if summary['months']:
+            return summary['savings']
+    return 0
@@ -0,0 +1,370 @@
+import asyncio
+import contextvars
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .metrics import timed
+from .resilience import ERROR, UNKNOWN, breaker, negative_entries, remember
+
+OFFLINE_PRICES = Path(__file__).resolve().parent / 'data' / 'offline_prices.json'
+
+logger = logging.getLogger(__name__)
+
+# Threads for async fetches. Kept apart from the event loop's default executor so
+# calls stuck on a hung upstream can't starve everything else that uses it.
+_async_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'FINANCEAPP_FETCH_THREADS', 32), thread_name_prefix='marketdata')
+
+# Batches per upstream still running in _async_executor after their afetch_many
+# call gave up on them. Threads can't be interrupted, so while an upstream has
+# max_workers of these, new batches for it are skipped instead of piling more
+# threads onto a hung upstream.
+_abandoned = defaultdict(int)
+_abandoned_lock = threading.Lock()
+
+
+def _abandon(upstream, future):
+    with _abandoned_lock:
+        _abandoned[upstream] += 1
+
+    def finished(_):
+        with _abandoned_lock:
+            _abandoned[upstream] -= 1
+    future.add_done_callback(finished)
+
+
+def to_nav(value):
+    return Decimal(str(round(float(value), 4)))
+
+
+@dataclass(frozen=True)
+class Quote:
+    """A fund's latest NAV/close and the trading day it's for (None when the provider doesn't say)."""
+    nav: Decimal
+    date: datetime.date = None
+
+
+class RateLimiter:
+    """Spaces out calls so no more than ``per_second`` start each second, across threads."""
+
+    def __init__(self, per_second=None):
+        self.interval = 1 / per_second if per_second else 0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class PriceProvider:
+    """
+    Looks up latest NAVs/closes as {ticker: Quote}. Subclasses implement
+    ``fetch_batch``, a single upstream call for up to ``batch_size`` tickers;
+    ``fetch_many`` splits the request into batches and fans them out over a
+    bounded thread pool, with calls throttled to ``rate_limit`` per second.
+    Unknown tickers are simply missing from the result.
+    """
+    batch_size = 1
+    max_workers = 1
+    rate_limit = None
+
+    def __init__(self, batch_size=None, max_workers=None, rate_limit=None):
+        self.batch_size = batch_size or self.batch_size
+        self.max_workers = max_workers or self.max_workers
+        self.rate_limit = rate_limit or self.rate_limit
+        self.limiter = RateLimiter(self.rate_limit)
+        self.upstream = type(self).__name__
+
+    def fetch_batch(self, tickers):
+        raise NotImplementedError
+
+    def fetch_many(self, tickers):
+        tickers = sorted({t.upper() for t in tickers})
+        batches = [tickers[i:i + self.batch_size] for i in range(0, len(tickers), self.batch_size)]
+        prices = {}
+        if not batches:
+            return prices
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+            futures = [(batch, pool.submit(contextvars.copy_context().run, self._fetch, batch)) for batch in batches]
+            for batch, future in futures:
+                try:
+                    prices.update(future.result())
+                except Exception:
+                    logger.exception('%s failed for %s', self.upstream, ', '.join(batch))
+        return prices
+
+    def _fetch(self, batch):
+        self.limiter.wait()
+        with timed(type(self).__name__, external=True):
+            return self.fetch_batch(batch)
+
+    async def afetch_many(self, tickers, concurrency=None, timeout=None):
+        """
+        Async fetch_many: batches run in worker threads with at most ``concurrency``
+        in flight, and the call gives up after ``timeout`` seconds, returning
+        whatever batches finished. Batches not yet started when the call times out
+        (or its caller is cancelled) are dropped; ones already running can't be
+        interrupted and finish in the background. While ``max_workers`` such
+        batches are still stuck on this upstream, new batches are skipped.
+        """
+        tickers = sorted({t.upper() for t in tickers})
+        batches = [tickers[i:i + self.batch_size] for i in range(0, len(tickers), self.batch_size)]
+        semaphore = asyncio.Semaphore(concurrency or self.max_workers)
+        prices, skipped = {}, []
+
+        async def fetch(batch):
+            async with semaphore:
+                with _abandoned_lock:
+                    stuck = _abandoned[self.upstream]
+                if stuck >= self.max_workers:
+                    skipped.append(batch)
+                    return
+                future = _async_executor.submit(contextvars.copy_context().run, self._fetch, batch)
+                try:
+                    prices.update(await asyncio.wrap_future(future))
+                except asyncio.CancelledError:
+                    # Cancelling the wrapper cancels the batch unless its thread already started
+                    if not future.cancelled():
+                        _abandon(self.upstream, future)
+                    raise
+                except Exception:
+                    logger.exception('%s failed for %s', self.upstream, ', '.join(batch))
+
+        tasks = [asyncio.create_task(fetch(batch)) for batch in batches]
+        if tasks:
+            try:
+                await asyncio.wait(tasks, timeout=timeout)
+            finally:
+                # Whether the call timed out or its caller was cancelled, cancel what's
+                # left and let it settle, so running threads are counted as abandoned
+                pending = [task for task in tasks if not task.done()]
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            if pending:
+                logger.warning('%s timed out on %d of %d batches', self.upstream, len(pending), len(tasks))
+            if skipped:
+                logger.warning('%s skipped %d of %d batches, earlier ones are still stuck upstream', self.upstream, len(skipped), len(tasks))
+        return prices
+
+    def nav(self, ticker):
+        quote = self.fetch_many([ticker]).get(ticker.upper())
+        return quote.nav if quote else None
+
+    def fetch_history(self, tickers, start, end=None):
+        """Daily NAVs since ``start`` as {ticker: [(date, nav), ...]}, for providers that have history."""
+        raise NotImplementedError(f"{type(self).__name__} has no price history")
+
+
+class YFinanceProvider(PriceProvider):
+    batch_size = 100
+    max_workers = 4
+    rate_limit = 2
+
+    def fetch_batch(self, tickers):
+        import yfinance as yf
+
+        data = yf.download(tickers, period='5d', interval='1d', auto_adjust=False, progress=False, threads=False)
+        if data.empty:
+            return {}
+        closes = data['Close']
+        if closes.ndim == 1:
+            closes = closes.to_frame(tickers[0])
+
+        prices = {}
+        for ticker in tickers:
+            if ticker not in closes:
+                continue
+            series = closes[ticker].dropna()
+            if not series.empty:
+                prices[ticker] = Quote(to_nav(series.iloc[-1]), series.index[-1].date())
+        return prices
+
+    def fetch_history(self, tickers, start, end=None):
+        import yfinance as yf
+
+        tickers = sorted({t.upper() for t in tickers})
+        history = {}
+        for i in range(0, len(tickers), self.batch_size):
+            batch = tickers[i:i + self.batch_size]
+            self.limiter.wait()
+            data = yf.download(batch, start=start, end=end, interval='1d', auto_adjust=False, progress=False, threads=False)
+            if data.empty:
+                continue
+            closes = data['Close']
+            if closes.ndim == 1:
+                closes = closes.to_frame(batch[0])
+            for ticker in batch:
+                if ticker in closes:
+                    series = closes[ticker].dropna()
+                    history[ticker] = [(day.date(), to_nav(close)) for day, close in series.items()]
+        return history
+
+
+class MorningstarProvider(PriceProvider):
+    # mstarpy has no multi-fund quote call, so every ticker is its own request.
+    max_workers = 4
+    rate_limit = 5
+
+    def fetch_batch(self, tickers):
+        import mstarpy
+
+        end = datetime.date.today()
+        start = end - datetime.timedelta(days=10)
+        prices = {}
+        for ticker in tickers:
+            history = mstarpy.Funds(ticker, pageSize=1).nav(start, end)
+            if history:
+                latest = history[-1]
+                prices[ticker] = Quote(to_nav(latest['nav']), datetime.date.fromisoformat(latest['date'][:10]))
+        return prices
+
+
+class StaticProvider(PriceProvider):
+    """Serves prices from a dict, for tests, quoted for ``as_of`` if given."""
+    batch_size = 1000
+
+    def __init__(self, prices, as_of=None, **kwargs):
+        super().__init__(**kwargs)
+        self.prices = {ticker.upper(): Decimal(str(price)) for ticker, price in prices.items()}
+        self.as_of = as_of
+
+    def fetch_batch(self, tickers):
+        return {t: Quote(self.prices[t], self.as_of) for t in tickers if t in self.prices}
+
+
+class OfflineProvider(StaticProvider):
+    """Serves prices from a JSON fixture of {ticker: nav}, for tests and benchmarks."""
+
+    def __init__(self, path=None, **kwargs):
+        path = path or getattr(settings, 'FINANCEAPP_OFFLINE_PRICES', OFFLINE_PRICES)
+        with open(path) as f:
+            super().__init__(json.load(f), **kwargs)
+
+
+class SlowProvider(OfflineProvider):
+    """OfflineProvider that sleeps ``delay`` seconds per call, to simulate a degraded upstream in load tests."""
+    batch_size = 1
+    max_workers = 8
+
+    def __init__(self, delay=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+
+    def fetch_batch(self, tickers):
+        time.sleep(self.delay)
+        return super().fetch_batch(tickers)
+
+
+class FaultyProvider(OfflineProvider):
+    """
+    OfflineProvider that fails ``failure_rate`` of its calls with ``error`` (and
+    can be switched wholly down with ``healthy = False``), to exercise the
+    resilience layer.
+    """
+
+    def __init__(self, failure_rate=0.0, seed=None, error=ConnectionError, **kwargs):
+        super().__init__(**kwargs)
+        self.failure_rate = failure_rate
+        self.error = error
+        self.healthy = True
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def fetch_batch(self, tickers):
+        self.calls += 1
+        if not self.healthy or self._random.random() < self.failure_rate:
+            raise self.error(f'{type(self).__name__}: injected failure')
+        return super().fetch_batch(tickers)
+
+
+class ResilientProvider(PriceProvider):
+    """
+    Wraps a provider with the negative cache and a circuit breaker (see
+    resilience.py). Tickers recently found unknown or failing are skipped, and
+    while the breaker is open batches come back empty at once, so refreshes
+    keep the last known NAVs instead of waiting on a failing upstream.
+    """
+
+    def __init__(self, provider):
+        super().__init__(provider.batch_size, provider.max_workers, provider.rate_limit)
+        self.provider = provider
+        self.upstream = type(provider).__name__
+        self.breaker = breaker(self.upstream)
+
+    def fetch_batch(self, tickers):
+        skipped = negative_entries(tickers)
+        tickers = [t for t in tickers if t not in skipped]
+        if not tickers or not self.breaker.allow():
+            return {}
+        try:
+            with timed(type(self.provider).__name__, external=True):
+                prices = self.provider.fetch_batch(tickers)
+        except Exception:
+            self.breaker.failure()
+            remember(tickers, ERROR)
+            raise
+        missing = [t for t in tickers if t not in prices]
+        if len(tickers) > 1 and len(missing) == len(tickers):
+            # A multi-ticker batch with nothing priced looks like an upstream
+            # problem (yfinance answers rate limits with an empty frame), not unknown tickers
+            self.breaker.failure()
+            remember(missing, ERROR)
+        else:
+            self.breaker.success()
+            remember(missing, UNKNOWN)
+        return prices
+
+    def _fetch(self, batch):
+        self.limiter.wait()
+        return self.fetch_batch(batch)
+
+    def fetch_history(self, tickers, start, end=None):
+        if type(self.provider).fetch_history is PriceProvider.fetch_history:
+            # No history at all: raise before allow(), which could make this call the half-open probe
+            return self.provider.fetch_history(tickers, start, end)
+        if not self.breaker.allow():
+            return {}
+        try:
+            history = self.provider.fetch_history(tickers, start, end)
+        except NotImplementedError:
+            # Not an upstream failure, but it may have been the probe: don't leave the breaker half-open
+            self.breaker.success()
+            raise
+        except Exception:
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+        return history
+
+
+def get_provider():
+    """
+    The configured provider (settings.FINANCEAPP_PRICE_PROVIDER, built with
+    FINANCEAPP_PRICE_PROVIDER_OPTIONS), wrapped in ResilientProvider unless
+    FINANCEAPP_RESILIENT_PROVIDER is False.
+    """
+    path = getattr(settings, 'FINANCEAPP_PRICE_PROVIDER', 'financeapp.providers.YFinanceProvider')
+    options = getattr(settings, 'FINANCEAPP_PRICE_PROVIDER_OPTIONS', {})
+    provider = import_string(path)(**options)
+    if getattr(settings, 'FINANCEAPP_RESILIENT_PROVIDER', True):
+        provider = ResilientProvider(provider)
+    return provider
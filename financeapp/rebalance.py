@@ -0,0 +1,151 @@
+import numpy as np
+from django.conf import settings
+
+from .benchmarks import benchmark_tickers, get_benchmarks
+from .exposure import FundMatrix, cap_label
+from .metrics import timed
+from .models import CAP_ATTRS, Fund, Holding
+
+DEFAULT_WEIGHTS = {'regions': 1.0, 'sectors': 1.0, 'caps': 1.0}
+MAX_TRADES = 10
+# Weight of the "weights sum to 1" row, large enough to act as the cash constraint
+BUDGET_WEIGHT = 1e3
+MIN_TRADE = 0.01
+
+
+class Problem:
+    """
+    The fund universe as one weighted least-squares system: a column per fund and
+    a row per region, sector and cap-style exposure (as fractions), so that
+    ``features @ weights`` is a portfolio's exposure vector.
+    """
+
+    def __init__(self, funds, target):
+        self.matrix = FundMatrix(funds)
+        weights = {**DEFAULT_WEIGHTS, **getattr(settings, 'FINANCEAPP_REBALANCE_WEIGHTS', {})}
+        blocks, targets, scales, self.labels = [], [], [], []
+        for group, columns, labels, goal in (
+            ('regions', self.matrix.regions, self.matrix.region_labels, target['regions']),
+            ('sectors', self.matrix.sectors, self.matrix.sector_labels, target['sectors']),
+            ('caps', self.matrix.caps, [cap_label(attr) for attr in CAP_ATTRS], dict(zip([cap_label(attr) for attr in CAP_ATTRS], target['caps']))),
+        ):
+            # Labels only the target has still count: no candidate fund can supply them
+            extra = [label for label in goal if label not in labels]
+            blocks.append(np.hstack([columns, np.zeros((len(self.matrix.funds), len(extra)))]))
+            targets.append([float(goal.get(label, 0)) for label in [*labels, *extra]])
+            scales.append(np.full(len(labels) + len(extra), np.sqrt(weights[group])))
+            self.labels += [(group, label) for label in [*labels, *extra]]
+        scale = np.concatenate(scales)
+        self.features = np.hstack(blocks).T / 100 * scale[:, None]
+        self.target = np.concatenate(targets) / 100 * scale
+
+    def distance(self, values):
+        """Weighted RMS gap to the target, in percentage points, for dollar ``values`` per fund."""
+        total = values.sum()
+        if total <= 0:
+            return None
+        return float(np.sqrt(np.mean((self.features @ (values / total) - self.target) ** 2)) * 100)
+
+    def solve(self, current, cash=0.0, allow_sell=False, max_trades=MAX_TRADES):
+        """
+        Target dollar value per fund for a portfolio holding ``current`` (dollars per
+        fund) plus ``cash`` to invest. Without ``allow_sell`` no position shrinks;
+        at most ``max_trades`` funds are bought.
+        """
+        from scipy.optimize import lsq_linear  # SciPy only loads when someone rebalances
+
+        current = np.asarray(current, dtype=float)
+        total = current.sum() + cash
+        if total <= 0:
+            return current
+        lower = np.zeros_like(current) if allow_sell else current / total
+        free = np.ones(len(current), dtype=bool)
+        with timed('rebalance'):
+            weights = self._fit(lsq_linear, lower, free)
+            if max_trades and free.sum() > max_trades:
+                # Re-solve over the most useful funds so the advice is a handful of trades
+                free[:] = False
+                free[np.argsort(lower - weights)[:max_trades]] = True
+                if allow_sell:
+                    free |= current > 0
+                weights = self._fit(lsq_linear, lower, free)
+        return weights * total
+
+    def _fit(self, lsq_linear, lower, free):
+        features = np.vstack([self.features, np.full(len(lower), BUDGET_WEIGHT)])
+        target = np.append(self.target, BUDGET_WEIGHT)
+        # Funds outside ``free`` stay at their lower bound
+        target = target - features[:, ~free] @ lower[~free]
+        weights = lower.copy()
+        if free.any():
+            result = lsq_linear(features[:, free], target, bounds=(lower[free], lower[free] + 1), method='bvls')
+            weights[free] = result.x
+        # The budget row is a soft constraint, so spread any residual over the new money exactly
+        extra = weights - lower
+        if extra.sum() > 0:
+            weights = lower + extra * ((1 - lower.sum()) / extra.sum())
+        return weights
+
+    def trades(self, current, proposed):
+        trades = []
+        for fund, now, then in zip(self.matrix.funds, current, proposed):
+            trade = then - now
+            if abs(trade) >= MIN_TRADE:
+                trades.append({
+                    'ticker': fund.ticker,
+                    'current': round(float(now), 2),
+                    'target': round(float(then), 2),
+                    'trade': round(float(trade), 2),
+                    'shares': round(float(trade) / float(fund.nav), 4) if fund.nav else None,
+                })
+        return sorted(trades, key=lambda t: -t['trade'])
+
+    def result(self, current, proposed):
+        return {
+            'trades': self.trades(current, proposed),
+            'distance_before': self.distance(current),
+            'distance_after': self.distance(proposed),
+        }
+
+
+def _prefetched(funds):
+    return funds.filter(nav__isnull=False).prefetch_related('region_allocations', 'sector_allocations')
+
+
+def _target():
+    ticker = benchmark_tickers()['total']
+    return get_benchmarks([ticker])[ticker.upper()]
+
+
+def rebalance_portfolio(portfolio, cash=0.0, allow_sell=False, candidates=(), universe=False, max_trades=MAX_TRADES):
+    """
+    Trades that move ``portfolio`` (plus ``cash`` of new money) closest to the
+    total-market benchmark's exposures. Candidates are the portfolio's own funds,
+    the benchmark funds and ``candidates`` tickers, or every priced fund with ``universe``.
+    """
+    holdings = {h.fund_id: h for h in portfolio.holdings.select_related('fund')}
+    funds = Fund.objects.all() if universe else Fund.objects.filter(ticker__in=[t.upper() for t in [*candidates, *benchmark_tickers().values()]]) | Fund.objects.filter(id__in=holdings)
+    funds = list(_prefetched(funds).distinct())
+    problem = Problem(funds, _target())
+    current = np.array([float(holdings[f.id].shares * f.nav) if f.id in holdings else 0.0 for f in funds])
+    return problem.result(current, problem.solve(current, cash, allow_sell, max_trades))
+
+
+def rebalance_all(cash=0.0, allow_sell=False, max_trades=MAX_TRADES):
+    """
+    Yield (portfolio_id, result) for every portfolio with holdings, over one
+    shared candidate universe (every held fund plus the benchmark funds).
+    """
+    holdings = list(Holding.objects.values_list('portfolio_id', 'fund_id', 'shares'))
+    funds = list(_prefetched(Fund.objects.filter(id__in={fund_id for _, fund_id, _ in holdings}) | Fund.objects.filter(ticker__in=benchmark_tickers().values())).distinct())
+    problem = Problem(funds, _target())
+    index = {fund.id: i for i, fund in enumerate(funds)}
+    navs = problem.matrix.navs
+
+    portfolios = {}
+    for portfolio_id, fund_id, shares in holdings:
+        if fund_id in index:
+            current = portfolios.setdefault(portfolio_id, np.zeros(len(funds)))
+            current[index[fund_id]] += float(shares) * navs[index[fund_id]]
+    for portfolio_id, current in sorted(portfolios.items()):
+        yield portfolio_id, problem.result(current, problem.solve(current, cash, allow_sell, max_trades))
@@ -0,0 +1,91 @@
+import datetime
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .benchmarks import benchmark_tickers
+from .models import Fund
+from .performance import ingest_prices
+
+logger = logging.getLogger(__name__)
+
+
+def last_trading_day(today=None):
+    """Most recent weekday on or before ``today``."""
+    day = today or timezone.localdate()
+    while day.weekday() >= 5:
+        day -= datetime.timedelta(days=1)
+    return day
+
+
+def stale_funds(as_of=None):
+    """
+    Funds that are held by someone (or used as a benchmark) and haven't been
+    priced for ``as_of`` yet, stalest first.
+    """
+    as_of = as_of or last_trading_day()
+    return (
+        Fund.objects
+        .filter(Q(holding__isnull=False) | Q(ticker__in=benchmark_tickers().values()))
+        .filter(Q(last_updated__lt=as_of) | Q(nav__isnull=True))
+        .distinct()
+        .order_by('last_updated', 'ticker')
+    )
+
+
+def _apply(fund, quote, as_of):
+    # A quote from before as_of (no close yet today, a holiday) is kept under its
+    # own day, so the fund stays stale instead of copying the close forward
+    fund.nav = quote.nav
+    fund.last_updated = quote.date or as_of
+
+
+def refresh_funds(provider, funds=None, as_of=None):
+    """
+    Pull fresh NAVs for the funds from ``provider`` in one batched ``fetch_many``
+    call and record them in the price history under the trading day each quote
+    is for (``as_of`` when the provider doesn't say). Defaults to every fund
+    stale for ``as_of``. Returns the refreshed and failed tickers.
+    """
+    as_of = as_of or last_trading_day()
+    if funds is None:
+        funds = stale_funds(as_of)
+
+    funds = list(funds)
+    try:
+        prices = provider.fetch_many([fund.ticker for fund in funds])
+    except Exception:
+        logger.exception('Fetching prices for %d funds failed', len(funds))
+        prices = {}
+
+    refreshed, failed = [], []
+    with transaction.atomic():
+        for fund in funds:
+            quote = prices.get(fund.ticker.upper())
+            if quote is None:
+                failed.append(fund.ticker)
+                continue
+            _apply(fund, quote, as_of)
+            fund.save(update_fields=['nav', 'last_updated'])
+            refreshed.append(fund)
+        ingest_prices((fund.id, fund.last_updated, fund.nav) for fund in refreshed)
+    return [fund.ticker for fund in refreshed], failed
+
+
+async def arefresh_funds(provider, funds, as_of=None, timeout=None):
+    """
+    Async refresh_funds for ASGI views: quotes are fetched concurrently through
+    ``provider.afetch_many``, bounded by ``timeout`` seconds. Funds that weren't
+    priced in time keep their last NAV and count as failed.
+    """
+    as_of = as_of or last_trading_day()
+    prices = await provider.afetch_many([fund.ticker for fund in funds], timeout=timeout)
+    priced = [fund for fund in funds if fund.ticker.upper() in prices]
+    for fund in priced:
+        _apply(fund, prices[fund.ticker.upper()], as_of)
+        await fund.asave(update_fields=['nav', 'last_updated'])
+    await sync_to_async(ingest_prices)([(fund.id, fund.last_updated, fund.nav) for fund in priced])
+    return [fund.ticker for fund in priced], [fund.ticker for fund in funds if fund not in priced]
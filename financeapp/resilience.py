@@ -0,0 +1,165 @@
+"""
+Keeps slow or failing market-data lookups off the request path.
+
+A negative cache (the Django cache) remembers tickers upstream doesn't know for
+a day and tickers whose lookup just failed for a minute, so they aren't retried
+on every request. A circuit breaker per upstream (one per provider class, plus
+one for getFund) opens after repeated failures; while open, callers fall back
+immediately (refreshes keep the last known Fund.nav), and after a cool-down a
+single half-open probe decides whether to close it again.
+
+Settings:
+    FINANCEAPP_CIRCUIT_FAILURES      consecutive failures that open a breaker (default 5)
+    FINANCEAPP_CIRCUIT_RESET         seconds an open breaker waits before probing (default 30)
+    FINANCEAPP_UNKNOWN_TICKER_TTL    seconds an unknown ticker stays cached (default 1 day)
+    FINANCEAPP_LOOKUP_ERROR_TTL      seconds a failed lookup stays cached (default 60)
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from prometheus_client import Counter, Gauge
+
+from .metrics import record_cache, timed
+
+CIRCUIT_TRIPS = Counter('financeapp_circuit_trips', "Times a market-data circuit breaker opened", ['breaker'])
+CIRCUIT_FALLBACKS = Counter('financeapp_circuit_fallbacks', "Market-data calls skipped because a breaker was open", ['breaker'])
+# Each worker has its own breakers; in multiprocess mode report the worst live one
+CIRCUIT_STATE = Gauge('financeapp_circuit_state', "Breaker state: 0 closed, 1 half-open, 2 open", ['breaker'], multiprocess_mode='livemax')
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half-open', 'open'
+UNKNOWN, ERROR = 'unknown', 'error'
+DEFAULT_FAILURES = 5
+DEFAULT_RESET = 30
+DEFAULT_UNKNOWN_TTL = 60 * 60 * 24
+DEFAULT_ERROR_TTL = 60
+# What getFund raises for a symbol upstream doesn't have, as opposed to an outage.
+# ValueError isn't one: parsing a bad upstream response raises it too, and caching
+# that as an unknown ticker for a day would hide the outage.
+NOT_FOUND_ERRORS = (ObjectDoesNotExist, LookupError)
+
+
+class MarketDataUnavailable(Exception):
+    """Raised instead of calling upstream while its breaker is open or its last failure is cached."""
+
+
+class UnknownTicker(LookupError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through and consecutive failures are counted. Open: calls
+    are refused until ``reset_timeout`` has passed. Half-open: one probe call
+    is let through; success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or getattr(settings, 'FINANCEAPP_CIRCUIT_FAILURES', DEFAULT_FAILURES)
+        self.reset_timeout = reset_timeout if reset_timeout is not None else getattr(settings, 'FINANCEAPP_CIRCUIT_RESET', DEFAULT_RESET)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(name).set(0)
+
+    def _set_state(self, state):
+        self.state = state
+        CIRCUIT_STATE.labels(self.name).set({CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[state])
+
+    def allow(self):
+        """Whether a call may go upstream now. Counts a fallback when it may not."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+                return True  # this caller is the probe
+            if self.state == CLOSED:
+                return True
+        CIRCUIT_FALLBACKS.labels(self.name).inc()
+        return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+                CIRCUIT_TRIPS.labels(self.name).inc()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name):
+    """The process-wide breaker for upstream ``name``."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def _key(ticker):
+    return f'financeapp:negative:{ticker.upper()}'
+
+
+def negative_entries(tickers):
+    """{ticker: UNKNOWN or ERROR} for the ``tickers`` in the negative cache."""
+    keys = {_key(t): t.upper() for t in tickers}
+    cached = cache.get_many(list(keys))
+    record_cache('negative', hits=len(cached), misses=len(keys) - len(cached))
+    return {keys[key]: state for key, state in cached.items()}
+
+
+def remember(tickers, state):
+    ttl = (getattr(settings, 'FINANCEAPP_UNKNOWN_TICKER_TTL', DEFAULT_UNKNOWN_TTL) if state == UNKNOWN
+           else getattr(settings, 'FINANCEAPP_LOOKUP_ERROR_TTL', DEFAULT_ERROR_TTL))
+    if tickers:
+        cache.set_many({_key(t): state for t in tickers}, timeout=ttl)
+
+
+def forget(tickers):
+    cache.delete_many([_key(t) for t in tickers])
+
+
+def lookup_fund(symbol):
+    """
+    getFund behind the negative cache and the 'getFund' breaker: raises
+    UnknownTicker or MarketDataUnavailable straight away instead of repeating
+    a lookup that just failed. Upstream failures surface as MarketDataUnavailable.
+    """
+    symbol = symbol.upper()
+    state = negative_entries([symbol]).get(symbol)
+    if state == UNKNOWN:
+        raise UnknownTicker(f'Unknown ticker {symbol}')
+    if state == ERROR:
+        raise MarketDataUnavailable(f'Market data for {symbol} is temporarily unavailable')
+    guard = breaker('getFund')
+    if not guard.allow():
+        raise MarketDataUnavailable('Market data is temporarily unavailable')
+
+    from .util import getFund  # market-data stack loads on first use, not at worker start
+
+    try:
+        with timed('getFund', external=True):
+            fund = getFund(symbol)
+    except NOT_FOUND_ERRORS:
+        # Upstream answered; it just doesn't have this symbol
+        guard.success()
+        remember([symbol], UNKNOWN)
+        raise
+    except Exception as e:
+        guard.failure()
+        remember([symbol], ERROR)
+        raise MarketDataUnavailable(f'Market data for {symbol} is unavailable: {e}') from e
+    guard.success()
+    return fund
@@ -0,0 +1,202 @@
+import difflib
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections, transaction
+
+from .models import Fund
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = {'ticker', 'name', 'isin'}
+TICKER, ISIN, NAME = 0, 1, 2
+DEFAULT_LIMIT = 10
+# Prefix entries looked at per query; plenty to rank 10 results from
+MAX_CANDIDATES = 200
+STAMP_KEY = 'financeapp:fund_index:stamp'
+# Bigger changes rebuild the index instead of inserting fund by fund
+MAX_INCREMENTAL = 100
+# How often (seconds) a worker checks whether another process changed the fund list
+DEFAULT_CHECK_INTERVAL = 30
+
+
+def _bucket(ticker):
+    return ticker[:1], len(ticker)
+
+
+class IndexDrift(Exception):
+    """A fund's entries aren't where the index expects them."""
+
+
+def _terms(ticker, name, isin):
+    """(term, kind) pairs a fund is found by: its ticker, ISIN and every word-suffix of its name."""
+    terms = [(ticker.upper(), TICKER)]
+    if isin:
+        terms.append((isin.upper(), ISIN))
+    words = (name or '').upper().split()
+    terms += [(' '.join(words[i:]), NAME) for i in range(len(words))]
+    return terms
+
+
+class FundIndex:
+    """
+    Prefix and fuzzy search over every fund's ticker, name and ISIN. Terms live
+    in one sorted list (with a parallel list of (kind, fund id)), so a prefix
+    query is a bisect plus a short scan, and single funds can be added or
+    removed in place. Built lazily from the database on first search.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built = False
+        self.stamp = None
+        self.checked = 0.0
+
+    def build(self):
+        rows = list(Fund.objects.values_list('id', 'ticker', 'name', 'isin'))
+        entries = sorted((term, kind, fund_id) for fund_id, ticker, name, isin in rows for term, kind in _terms(ticker, name, isin))
+        with self.lock:
+            self.funds = {fund_id: (ticker, name, isin) for fund_id, ticker, name, isin in rows}
+            self.terms = [term for term, _, _ in entries]
+            self.entries = [(kind, fund_id) for _, kind, fund_id in entries]
+            # (first letter, length) -> tickers, so a typo is only compared against look-alikes
+            self.tickers = defaultdict(set)
+            for _, ticker, _, _ in rows:
+                self.tickers[_bucket(ticker.upper())].add(ticker.upper())
+            self.by_ticker = {ticker.upper(): fund_id for fund_id, ticker, _, _ in rows}
+            self.built = True
+
+    def _ensure_current(self):
+        now = time.monotonic()
+        if self.built and now - self.checked < getattr(settings, 'FINANCEAPP_SEARCH_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL):
+            return
+        stamp = cache.get(STAMP_KEY)
+        with self.lock:
+            if not self.built or stamp != self.stamp:
+                self.build()
+                self.stamp = stamp
+            self.checked = now
+
+    def _remove(self, fund_id):
+        ticker, name, isin = self.funds.pop(fund_id)
+        for term, kind in _terms(ticker, name, isin):
+            i = bisect_left(self.terms, term)
+            while i < len(self.terms) and self.terms[i] == term and self.entries[i] != (kind, fund_id):
+                i += 1
+            if i == len(self.terms) or self.terms[i] != term:
+                raise IndexDrift(f'No {term!r} entry for fund {fund_id}')
+            del self.terms[i], self.entries[i]
+        bucket = self.tickers.get(_bucket(ticker.upper()), ())
+        if ticker.upper() not in bucket or ticker.upper() not in self.by_ticker:
+            raise IndexDrift(f'No ticker entry for fund {fund_id}')
+        bucket.remove(ticker.upper())
+        del self.by_ticker[ticker.upper()]
+
+    def _add(self, fund_id, ticker, name, isin):
+        self.funds[fund_id] = (ticker, name, isin)
+        for term, kind in _terms(ticker, name, isin):
+            i = bisect_left(self.terms, term)
+            # Keep entries for the same term in (kind, fund id) order, as build() does
+            while i < len(self.terms) and self.terms[i] == term and self.entries[i] < (kind, fund_id):
+                i += 1
+            self.terms.insert(i, term)
+            self.entries.insert(i, (kind, fund_id))
+        self.tickers[_bucket(ticker.upper())].add(ticker.upper())
+        self.by_ticker[ticker.upper()] = fund_id
+
+    def update(self, funds=(), removed=()):
+        """Apply added/changed ``funds`` and ``removed`` fund ids in place (no-op until built)."""
+        with self.lock:
+            if not self.built:
+                return
+            try:
+                for fund_id in removed:
+                    if fund_id in self.funds:
+                        self._remove(fund_id)
+                for fund in funds:
+                    if fund.id in self.funds:
+                        self._remove(fund.id)
+                    self._add(fund.id, fund.ticker, fund.name, fund.isin)
+            except IndexDrift:
+                # The index no longer matches what it was built from (and is now half
+                # updated): rebuild on the next search rather than fail the commit hook
+                self.built = False
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """
+        Funds whose ticker, ISIN or any word-suffix of the name starts with
+        ``query``, best matches first (tickers, then ISINs, then names, shortest
+        term first). Falls back to close ticker spellings when nothing matches.
+        """
+        query = ' '.join(query.upper().split())
+        if not query:
+            return []
+        self._ensure_current()
+        with self.lock:
+            start = bisect_left(self.terms, query)
+            end = min(start + MAX_CANDIDATES, len(self.terms))
+            candidates = []
+            for i in range(start, end):
+                if not self.terms[i].startswith(query):
+                    break
+                kind, fund_id = self.entries[i]
+                candidates.append((self.terms[i] != query, kind, len(self.terms[i]), self.terms[i], fund_id))
+            ids = list(dict.fromkeys(fund_id for *_, fund_id in sorted(candidates)))[:limit]
+            if not ids:
+                ids = [self.by_ticker[t] for t in self.close_tickers(query, limit)]
+            return [{'ticker': self.funds[i][0], 'name': self.funds[i][1], 'isin': self.funds[i][2]} for i in ids]
+
+    def close_tickers(self, query, limit=DEFAULT_LIMIT):
+        """Tickers within a typo of ``query``, compared only against tickers with the same first letter and a length within one."""
+        with self.lock:
+            pool = [t for length in (len(query) - 1, len(query), len(query) + 1) for t in self.tickers.get((query[:1], length), ())]
+        return difflib.get_close_matches(query, pool, n=limit, cutoff=0.6)
+
+
+fund_index = FundIndex()
+
+
+def warm_index():
+    """
+    Build this process's index ahead of its first search. Called from the WSGI
+    and ASGI entry points rather than AppConfig.ready, so management commands
+    (migrate included) never query for it; under gunicorn --preload the workers
+    inherit the built index. Turned off with FINANCEAPP_SEARCH_WARMUP = False.
+    """
+    if not getattr(settings, 'FINANCEAPP_SEARCH_WARMUP', True):
+        return
+    try:
+        fund_index._ensure_current()
+    except DatabaseError:
+        logger.warning('Fund search index not warmed, it will be built on the first search', exc_info=True)
+    finally:
+        # Don't hand this connection on to forked workers
+        connections.close_all()
+
+
+def funds_changed(funds=(), removed=()):
+    """
+    Update this process's index once the transaction commits (rebuilding it on
+    the next search for large batches) and publish a new stamp, so other
+    workers rebuild theirs at their next check.
+    """
+    funds, removed = list(funds), list(removed)
+
+    def apply():
+        stamp = time.time_ns()
+        previous = cache.get(STAMP_KEY)
+        cache.set(STAMP_KEY, stamp, timeout=None)
+        with fund_index.lock:
+            if len(funds) + len(removed) > MAX_INCREMENTAL or previous != fund_index.stamp:
+                # Another worker changed funds too (or this is a bulk load): rebuild on next search
+                fund_index.stamp, fund_index.checked = None, 0.0
+            else:
+                fund_index.update(funds, removed)
+                if fund_index.built:
+                    fund_index.stamp = stamp
+    transaction.on_commit(apply)
@@ -0,0 +1,50 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import BudgetItem, Fund, Holding, Portfolio, RegionAllocation, SectorAllocation
+from .benchmarks import invalidate_benchmark, invalidate_benchmark_funds
+from .search import SEARCH_FIELDS, funds_changed
+from .snapshots import mark_dirty
+from .versions import BUDGET, PORTFOLIO, bump, bump_fund_holders, bump_portfolios
+
+
+@receiver([post_save, post_delete], sender=Holding)
+def holding_changed(sender, instance, **kwargs):
+    mark_dirty([instance.portfolio_id])
+    bump_portfolios([instance.portfolio_id])
+
+
+@receiver([post_save, post_delete], sender=BudgetItem)
+def budget_item_changed(sender, instance, **kwargs):
+    bump(BUDGET, [instance.user_id])
+
+
+@receiver(post_save, sender=Portfolio)
+def portfolio_changed(sender, instance, **kwargs):
+    # Monthly income is shown on the budget page
+    bump(PORTFOLIO, [instance.user_id])
+    bump(BUDGET, [instance.user_id])
+
+
+@receiver(post_save, sender=Fund)
+def fund_changed(sender, instance, created, update_fields=None, **kwargs):
+    invalidate_benchmark(instance.ticker)
+    # NAV refreshes save only nav/last_updated and leave the search index alone
+    if created or update_fields is None or SEARCH_FIELDS & set(update_fields):
+        funds_changed([instance])
+    if not created:
+        mark_dirty(fund_ids=[instance.id])
+        bump_fund_holders([instance.id])
+
+
+@receiver(post_delete, sender=Fund)
+def fund_deleted(sender, instance, **kwargs):
+    funds_changed(removed=[instance.id])
+
+
+@receiver([post_save, post_delete], sender=SectorAllocation)
+@receiver([post_save, post_delete], sender=RegionAllocation)
+def allocation_changed(sender, instance, **kwargs):
+    invalidate_benchmark_funds([instance.fund_id])
+    mark_dirty(fund_ids=[instance.fund_id])
+    bump_fund_holders([instance.fund_id])
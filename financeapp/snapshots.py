@@ -0,0 +1,90 @@
+from collections import defaultdict
+
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import record_cache, timed
+from .models import Holding, PortfolioSnapshot
+
+
+def _holdings(portfolio_ids):
+    return (
+        Holding.objects
+        .filter(portfolio_id__in=portfolio_ids)
+        .select_related('fund')
+        .prefetch_related('fund__region_allocations', 'fund__sector_allocations')
+        .order_by('portfolio_id', 'id')
+    )
+
+
+def _versions(portfolio_ids):
+    """
+    Snapshot versions for ``portfolio_ids``, read before their holdings are.
+    Missing snapshots are created (dirty) first, so a change made during the
+    recompute has a row to bump.
+    """
+    versions = dict(PortfolioSnapshot.objects.filter(portfolio_id__in=portfolio_ids).values_list('portfolio_id', 'version'))
+    missing = [portfolio_id for portfolio_id in portfolio_ids if portfolio_id not in versions]
+    if missing:
+        PortfolioSnapshot.objects.bulk_create([PortfolioSnapshot(portfolio_id=portfolio_id) for portfolio_id in missing], ignore_conflicts=True)
+        versions.update(PortfolioSnapshot.objects.filter(portfolio_id__in=missing).values_list('portfolio_id', 'version'))
+    return versions
+
+
+def _store(portfolio_id, holdings, version):
+    from .exposure import holding_exposures  # NumPy is only needed when a snapshot is recomputed
+
+    with timed('holding_exposures'):
+        exposures = holding_exposures(holdings)
+    values = {
+        'total_value': sum((round(h.fund.nav*h.shares, 2) for h in holdings if h.fund.nav is not None), 0),
+        'dirty': False,
+        'computed_at': timezone.now(),
+        **{field: [[label, str(p)] for label, p in exposures[field].items()] for field in PortfolioSnapshot.EXPOSURE_FIELDS},
+    }
+    # Compare-and-set: if mark_dirty bumped the version since it was read, these
+    # holdings may be stale, so the row stays dirty for the next reader
+    stored = PortfolioSnapshot.objects.filter(portfolio_id=portfolio_id, version=version).update(**values)
+    snapshot = PortfolioSnapshot(portfolio_id=portfolio_id, version=version, **values)
+    snapshot.dirty = not stored
+    return snapshot
+
+
+def refresh_snapshots(portfolio_ids=None):
+    """
+    Recompute the given portfolios' snapshots (default: every dirty one), loading
+    all of their holdings in one prefetched pass. Returns the number recomputed.
+    """
+    if portfolio_ids is None:
+        portfolio_ids = list(PortfolioSnapshot.objects.filter(dirty=True).values_list('portfolio_id', flat=True))
+    versions = _versions(portfolio_ids)
+    by_portfolio = defaultdict(list)
+    for holding in _holdings(portfolio_ids):
+        by_portfolio[holding.portfolio_id].append(holding)
+    for portfolio_id in portfolio_ids:
+        _store(portfolio_id, by_portfolio[portfolio_id], versions[portfolio_id])
+    return len(portfolio_ids)
+
+
+def get_snapshot(portfolio):
+    """The portfolio's snapshot, recomputed first if it is missing or dirty."""
+    snapshot = PortfolioSnapshot.objects.filter(portfolio=portfolio).first()
+    fresh = snapshot is not None and not snapshot.dirty
+    record_cache('snapshot', hits=int(fresh), misses=int(not fresh))
+    if not fresh:
+        version = snapshot.version if snapshot is not None else _versions([portfolio.id])[portfolio.id]
+        snapshot = _store(portfolio.id, list(_holdings([portfolio.id])), version)
+    return snapshot
+
+
+def mark_dirty(portfolio_ids=None, fund_ids=None):
+    """
+    Flag snapshots for recompute, either by portfolio or for every portfolio
+    holding one of ``fund_ids``. The version is bumped even on snapshots that are
+    already dirty, so a recompute in progress can't store them as clean.
+    """
+    if fund_ids is not None:
+        snapshots = PortfolioSnapshot.objects.filter(portfolio__holdings__fund_id__in=fund_ids)
+    else:
+        snapshots = PortfolioSnapshot.objects.filter(portfolio_id__in=portfolio_ids)
+    snapshots.update(dirty=True, version=F('version') + 1)
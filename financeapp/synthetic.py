@@ -0,0 +1,71 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+
+from .models import CAP_ATTRS, BudgetItem, Fund, Holding, Portfolio, RegionAllocation, SectorAllocation
+
+REGIONS = ['United States', 'Canada', 'Latin America', 'United Kingdom', 'Europe Developed', 'Europe Emerging',
+           'Africa/Middle East', 'Japan', 'Australasia', 'Asia Developed', 'Asia Emerging']
+SECTORS = ['Technology', 'Financial Services', 'Healthcare', 'Consumer Cyclical', 'Industrials', 'Communication Services',
+           'Consumer Defensive', 'Energy', 'Basic Materials', 'Real Estate', 'Utilities']
+BUDGET_ITEMS = [('Rent', 'Need', 'Housing'), ('Groceries', 'Need', 'Food'), ('Electric', 'Need', 'Utilities'),
+                ('Gas', 'Need', 'Transport'), ('Restaurants', 'Want', 'Food'), ('Movies', 'Want', 'Entertainment'),
+                ('Clothes', 'Want', 'Shopping'), ('Travel', 'Want', 'Vacation')]
+
+
+def _split(rng, labels, count):
+    """Random percentages over ``count`` of ``labels`` that sum to 100."""
+    chosen = rng.sample(labels, count)
+    weights = [rng.random() for _ in chosen]
+    return {label: Decimal(round(100 * w / sum(weights), 2)).quantize(Decimal('0.01')) for label, w in zip(chosen, weights)}
+
+
+def make_funds(count, seed=0, benchmarks=('VT', 'VXUS')):
+    """``count`` funds (including the benchmark tickers) with random NAVs, cap styles and allocations."""
+    rng = random.Random(seed)
+    tickers = list(benchmarks) + [f'F{i:05d}' for i in range(count - len(benchmarks))]
+    funds = []
+    for ticker in tickers:
+        international = Decimal(rng.randint(0, 100))
+        caps = _split(rng, CAP_ATTRS, rng.randint(1, len(CAP_ATTRS)))
+        funds.append(Fund(
+            ticker=ticker, name=f'Synthetic {ticker}', nav=Decimal(rng.randint(500, 50000)) / 100,
+            last_updated=datetime.date.today(), domestic=100 - international, international=international,
+            **caps,
+        ))
+    funds = Fund.objects.bulk_create(funds, batch_size=1000)
+
+    regions, sectors = [], []
+    for fund in funds:
+        # Benchmarks cover every region/sector so the comparison rows are always populated
+        full = fund.ticker in benchmarks
+        for region, pct in _split(rng, REGIONS, len(REGIONS) if full else rng.randint(1, 5)).items():
+            regions.append(RegionAllocation(fund=fund, region=region, percentage=pct))
+        for sector, pct in _split(rng, SECTORS, len(SECTORS) if full else rng.randint(1, 8)).items():
+            sectors.append(SectorAllocation(fund=fund, sector=sector, percentage=pct))
+    RegionAllocation.objects.bulk_create(regions, batch_size=5000)
+    SectorAllocation.objects.bulk_create(sectors, batch_size=5000)
+    return funds
+
+
+def make_user(username, funds, holdings=10, budget_years=10, items_per_month=20, seed=0, income=Decimal('6000')):
+    """A user with a portfolio of ``holdings`` random funds and ``budget_years`` of monthly expenses."""
+    rng = random.Random(seed)
+    user = User.objects.create_user(username, password=username)
+    portfolio = Portfolio.objects.create(user=user, name=f"{username}'s Portfolio", monthly_income=income)
+    Holding.objects.bulk_create(
+        [Holding(portfolio=portfolio, fund=fund, shares=Decimal(rng.randint(1, 10**6)) / 10**4) for fund in rng.sample(funds, holdings)]
+    )
+
+    this_year = datetime.date.today().year
+    items = []
+    for year in range(this_year - budget_years + 1, this_year + 1):
+        for month in range(1, 13):
+            for _ in range(items_per_month):
+                item, category, subcategory = rng.choice(BUDGET_ITEMS)
+                items.append(BudgetItem(user=user, date=datetime.date(year, month, 1), item=item, category=category,
+                                        subcategory=subcategory, amount=Decimal(rng.randint(100, 200000)) / 100))
+    BudgetItem.objects.bulk_create(items, batch_size=5000)
+    return user
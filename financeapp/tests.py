@@ -1,3 +1,1180 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import pyarrow.parquet as pq
+from prometheus_client import REGISTRY
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, modify_settings, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from . import exporters, metrics, performance, providers, resilience, search, snapshots
+from .benchmarks import get_benchmarks
+from .budgeting import year_budget, year_range
+from .exporters import FORMATS, export_stream
+from .exposure import cap_label, exposures_by_portfolio, holding_exposures
+from .holdings import add_holding, purchase_shares
+from .importers import read_ofx
+from .models import CAP_ATTRS, BudgetItem, Fund, FundPrice, Holding, Portfolio, PortfolioSnapshot, RegionAllocation, SectorAllocation
+from .projection import MAX_PATHS, MAX_YEARS, SHARD_PATHS, project
+from .rebalance import MIN_TRADE, Problem, rebalance_portfolio
+from .refresh import arefresh_funds, last_trading_day, refresh_funds, stale_funds
+from .search import FundIndex
+from .universe import ingest_funds
+
+
+class BudgetItemIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('saver')
+        BudgetItem.objects.bulk_create([
+            BudgetItem(user=cls.user, date=datetime.date(2025, month, 1), item='Rent', category='Need', subcategory='Housing', amount=Decimal('1500'))
+            for month in range(1, 13)
+        ])
+
+    @skipUnless(connection.vendor == 'sqlite', "query plan text is SQLite's")
+    def test_year_filter_uses_user_date_index(self):
+        start, end = year_range(2025)
+        plan = BudgetItem.objects.filter(user=self.user, date__gte=start, date__lt=end).explain()
+        self.assertIn('budgetitem_user_date_idx', plan)
+
+    @skipUnless(connection.vendor == 'sqlite', "query plan text is SQLite's")
+    def test_available_years_use_user_date_index(self):
+        plan = BudgetItem.objects.filter(user=self.user).dates('date', 'year').explain()
+        self.assertIn('budgetitem_user_date_idx', plan)
+
+
+class MergeDuplicateHoldingsMigrationTests(TransactionTestCase):
+    before = [('financeapp', '0003_budgetitem_dedupe_idx')]
+    after = [('financeapp', '0005_holding_unique_budgetitem_user_date_idx')]
+
+    def tearDown(self):
+        MigrationExecutor(connection).migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged_before_the_unique_constraint(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        user = apps.get_model('auth', 'User').objects.create(username='dup')
+        portfolio = apps.get_model('financeapp', 'Portfolio').objects.create(user=user, name='P')
+        Fund = apps.get_model('financeapp', 'Fund')
+        Holding = apps.get_model('financeapp', 'Holding')
+        vt, bnd = Fund.objects.create(ticker='VT'), Fund.objects.create(ticker='BND')
+        Holding.objects.create(portfolio=portfolio, fund=vt, shares=Decimal('1.5'))
+        Holding.objects.create(portfolio=portfolio, fund=vt, shares=Decimal('2.25'))
+        Holding.objects.create(portfolio=portfolio, fund=bnd, shares=Decimal('3'))
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        Holding = executor.loader.project_state(self.after).apps.get_model('financeapp', 'Holding')
+        self.assertEqual(
+            sorted(Holding.objects.values_list('fund__ticker', 'shares')),
+            [('BND', Decimal('3')), ('VT', Decimal('3.75'))],
+        )
+
+
+class PriceSeriesCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        performance._series.clear()
+        self.fund = Fund.objects.create(ticker='VT')
+        performance.ingest_prices([(self.fund.id, datetime.date(2025, 1, 2), Decimal('100'))])
+
+    def test_another_process_ingesting_prices_drops_the_cache(self):
+        self.assertEqual(len(performance.price_series([self.fund.id])[self.fund.id][1]), 1)
+        # Written by another worker: only the shared stamp tells this one
+        FundPrice.objects.create(fund=self.fund, date=datetime.date(2025, 1, 3), nav=Decimal('101'))
+        self.assertEqual(len(performance.price_series([self.fund.id])[self.fund.id][1]), 1)
+        cache.set(performance.STAMP_KEY, 'elsewhere', timeout=None)
+        self.assertEqual(performance.price_series([self.fund.id])[self.fund.id][1].tolist(), [100.0, 101.0])
+
+    def test_ingesting_prices_publishes_a_stamp(self):
+        performance.price_series([self.fund.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            performance.ingest_prices([(self.fund.id, datetime.date(2025, 1, 3), Decimal('101'))])
+        self.assertIsNotNone(cache.get(performance.STAMP_KEY))
+        self.assertEqual(performance.price_series([self.fund.id])[self.fund.id][1].tolist(), [100.0, 101.0])
+
+
+class PortfolioPerformanceTests(TestCase):
+    # Exactly four years (one of them leap) from first to last price
+    days = [datetime.date(2021, 1, 4), datetime.date(2022, 3, 1), datetime.date(2023, 6, 1), datetime.date(2025, 1, 4)]
+
+    def setUp(self):
+        cache.clear()
+        performance._series.clear()
+        navs = {'AAA': ['40', '50', '39', '48.9'], 'BBB': ['30', '30', '30', '30'], 'VT': ['200', '210', '220', '230']}
+        self.funds = {ticker: Fund.objects.create(ticker=ticker) for ticker in navs}
+        performance.ingest_prices((self.funds[t].id, day, Decimal(nav)) for t, series in navs.items() for day, nav in zip(self.days, series))
+        # 1 AAA and 2 BBB: worth 100, 110, 99 and 108.9, returns of +10%, -10% and +10%
+        self.holdings = [Holding(fund=self.funds['AAA'], shares=Decimal('1')), Holding(fund=self.funds['BBB'], shares=Decimal('2'))]
+
+    def test_stats(self):
+        stats = performance._stats(np.array([100, 110, 99, 108.9]), np.array(self.days, dtype='datetime64[D]'))
+        self.assertAlmostEqual(stats['total_return'], 0.089)
+        # 1.089 ** (1/4) - 1
+        self.assertAlmostEqual(stats['annualized_return'], 0.0215442, places=6)
+        # Sample std of (0.1, -0.1, 0.1) is 0.2/sqrt(3), times sqrt(252)
+        self.assertAlmostEqual(stats['annualized_volatility'], 0.2 * 84 ** 0.5)
+        self.assertAlmostEqual(stats['max_drawdown'], -0.1)
+
+    def test_single_day_has_no_annualized_figures(self):
+        stats = performance._stats(np.array([100.0, 100.0]), np.array(self.days[:1] * 2, dtype='datetime64[D]'))
+        self.assertEqual((stats['total_return'], stats['annualized_return'], stats['annualized_volatility']), (0.0, None, None))
+
+    def test_portfolio_and_benchmark(self):
+        result = performance.portfolio_performance(self.holdings, benchmark='VT')
+        self.assertEqual((result['start'], result['end']), ('2021-01-04', '2025-01-04'))
+        self.assertAlmostEqual(result['portfolio']['total_return'], 0.089)
+        self.assertAlmostEqual(result['portfolio']['max_drawdown'], -0.1)
+        self.assertEqual(result['series']['growth'], [1.0, 1.1, 0.99, 1.089])
+        self.assertEqual(result['benchmark']['ticker'], 'VT')
+        self.assertAlmostEqual(result['benchmark']['total_return'], 0.15)
+        # 1.15 ** (1/4) - 1
+        self.assertAlmostEqual(result['benchmark']['annualized_return'], 0.0355581, places=6)
+        self.assertEqual(result['benchmark']['max_drawdown'], 0.0)
+        self.assertAlmostEqual(result['excess_return'], -0.061)
+
+    def test_period_and_late_funds(self):
+        result = performance.portfolio_performance(self.holdings, start=datetime.date(2022, 1, 1), end=datetime.date(2023, 12, 31), benchmark='NONE')
+        self.assertEqual((result['start'], result['end'], result['benchmark']), ('2022-03-01', '2023-06-01', None))
+        self.assertAlmostEqual(result['portfolio']['total_return'], -0.1)
+        self.assertNotIn('excess_return', result)
+        # A fund priced only from the second day moves the start up to it
+        late = Fund.objects.create(ticker='LATE')
+        performance.ingest_prices((late.id, day, Decimal('10')) for day in self.days[1:])
+        result = performance.portfolio_performance([*self.holdings, Holding(fund=late, shares=Decimal('1'))])
+        self.assertEqual(result['start'], '2022-03-01')
+        self.assertAlmostEqual(result['portfolio']['total_return'], 118.9 / 120 - 1)
+        self.assertIsNone(performance.portfolio_performance(self.holdings, start=datetime.date(2024, 1, 1)))
+
+
+def reference_exposures(holdings):
+    """The portfolio page's original Decimal loops, kept as the oracle for exposure.py."""
+    total = sum(h.fund.nav*h.shares for h in holdings)
+    regions, allocs, sectors = defaultdict(Decimal), defaultdict(Decimal), defaultdict(Decimal)
+    for h in holdings:
+        value = h.fund.nav*h.shares
+        for region in h.fund.region_allocations.all():
+            regions[region.region] += region.percentage*value
+        for attr in CAP_ATTRS:
+            allocs[cap_label(attr)] += getattr(h.fund, attr)*value
+        for sector in h.fund.sector_allocations.all():
+            sectors[sector.sector] += sector.percentage*value
+    return {name: {label: weighted/total for label, weighted in totals.items()}
+            for name, totals in [('regions', regions), ('allocs', allocs), ('sectors', sectors)]}
+
+
+class ExposureParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Allocations deliberately don't sum to 100: 90% of regions, 112.5% of sectors, partial cap styles
+        funds = {
+            'VTI': ('251.3700', {'United States': '99.10'}, {'Technology': '31.50', 'Healthcare': '12.25'}, {'large_cap_blend': '72.00', 'mid_cap_blend': '18.00'}),
+            'VXUS': ('63.0810', {'Europe': '38.40', 'Japan': '15.20', 'Emerging Markets': '26.40', 'United States': '10.00'},
+                     {'Financials': '21.00', 'Industrials': '15.75', 'Technology': '75.75'}, {'large_cap_value': '45.50', 'small_cap_value': '9.25'}),
+            'BND': ('72.4400', {}, {}, {}),
+        }
+        cls.funds = {}
+        for ticker, (nav, regions, sectors, caps) in funds.items():
+            fund = Fund.objects.create(ticker=ticker, nav=Decimal(nav), **{attr: Decimal(p) for attr, p in caps.items()})
+            RegionAllocation.objects.bulk_create([RegionAllocation(fund=fund, region=r, percentage=Decimal(p)) for r, p in regions.items()])
+            SectorAllocation.objects.bulk_create([SectorAllocation(fund=fund, sector=s, percentage=Decimal(p)) for s, p in sectors.items()])
+            cls.funds[ticker] = fund
+        positions = [
+            {'VTI': '12.3456', 'VXUS': '40.0001', 'BND': '7.5'},
+            {'VXUS': '3.1416'},
+            {'VTI': '0.0012', 'BND': '1000'},
+        ]
+        cls.portfolios = []
+        for i, shares in enumerate(positions):
+            portfolio = Portfolio.objects.create(user=User.objects.create_user(f'investor{i}'), name=f'P{i}')
+            Holding.objects.bulk_create([Holding(portfolio=portfolio, fund=cls.funds[t], shares=Decimal(n)) for t, n in shares.items()])
+            cls.portfolios.append(portfolio)
+
+    def holdings(self, portfolio=None):
+        holdings = Holding.objects.select_related('fund').prefetch_related('fund__region_allocations', 'fund__sector_allocations')
+        return list(holdings.filter(portfolio=portfolio) if portfolio else holdings)
+
+    def assertMatches(self, actual, expected):
+        self.assertEqual(set(actual), set(expected))
+        for label, percentage in expected.items():
+            self.assertAlmostEqual(float(actual[label]), float(percentage), delta=0.01, msg=label)
+
+    def test_holding_exposures_match_decimal_reference(self):
+        for portfolio in self.portfolios:
+            holdings = self.holdings(portfolio)
+            result, expected = holding_exposures(holdings), reference_exposures(holdings)
+            for name in ('regions', 'sectors'):
+                self.assertMatches(result[name], expected[name])
+            # Cap styles are every CAP_ATTRS column, held or not
+            self.assertMatches(result['allocs'], {cap_label(attr): expected['allocs'].get(cap_label(attr), 0) for attr in CAP_ATTRS})
+
+    def test_international_regions_rescale_to_non_us_share(self):
+        holdings = self.holdings(self.portfolios[0])
+        result = holding_exposures(holdings)
+        # As on the original page, rescaled from the rounded region shares
+        regions = {r: round(p, 2) for r, p in reference_exposures(holdings)['regions'].items()}
+        self.assertMatches(result['intl_regions'], {r: p/(100 - regions['United States'])*100 for r, p in regions.items() if r != 'United States'})
+
+    def test_exposures_by_portfolio_matches_per_portfolio_reference(self):
+        matrix, portfolio_ids, result = exposures_by_portfolio(self.holdings())
+        self.assertEqual(portfolio_ids, sorted(p.id for p in self.portfolios))
+        for row, portfolio_id in enumerate(portfolio_ids):
+            expected = reference_exposures(self.holdings(portfolio_id))
+            self.assertMatches(dict(zip(matrix.region_labels, result['regions'][row])),
+                               {label: expected['regions'].get(label, 0) for label in matrix.region_labels})
+            self.assertMatches(dict(zip(matrix.sector_labels, result['sectors'][row])),
+                               {label: expected['sectors'].get(label, 0) for label in matrix.sector_labels})
+
+    def test_no_holdings(self):
+        self.assertEqual(holding_exposures([]), {'regions': {}, 'intl_regions': {}, 'allocs': {}, 'sectors': {}})
+
+
+class BudgetQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budgeter')
+        Portfolio.objects.create(user=cls.user, name='Mine', monthly_income=Decimal('5000'))
+        BudgetItem.objects.bulk_create([
+            BudgetItem(user=cls.user, date=datetime.date(2025, month, 1), item=item, category=category, subcategory=subcategory, amount=Decimal(amount))
+            for month in range(1, 13)
+            for item, category, subcategory, amount in [('Rent', 'Need', 'Housing', '1500'), ('Groceries', 'Need', 'Food', '412.35'), ('Cinema', 'Want', 'Fun', '24')]
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_year_budget_is_two_queries_for_any_number_of_items(self):
+        with self.assertNumQueries(2):
+            result = year_budget(self.user, 2025, Decimal('5000'))
+        self.assertEqual(len(result['months']), 12)
+        BudgetItem.objects.bulk_create([BudgetItem(user=self.user, date=datetime.date(2025, 6, 1), item=f'Extra {i}', category='Want', subcategory=f'Misc {i}', amount=Decimal('1')) for i in range(50)])
+        with self.assertNumQueries(2):
+            year_budget(self.user, 2025, Decimal('5000'))
+
+    def test_budget_page(self):
+        # Session, user, portfolio, available years and year_budget's two
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('budget', args=[2025]))
+        self.assertContains(response, 'Groceries')
+
+    def test_budget_page_with_cached_summary_skips_year_budget(self):
+        # The first visit sets the CSRF cookie, which is part of the fragment's key
+        self.client.get(reverse('budget', args=[2025]))
+        self.client.get(reverse('budget', args=[2025]))
+        # No If-None-Match, so the page renders, but from the cached tables
+        with self.assertNumQueries(4):
+            self.client.get(reverse('budget', args=[2025]))
+
+
+class ConcurrentPurchaseTests(TransactionTestCase):
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_purchases_of_one_fund_make_one_holding(self):
+        portfolio = Portfolio.objects.create(user=User.objects.create_user('racer'), name='Race')
+        fund = Fund.objects.create(ticker='VTI', nav=Decimal('250'))
+        workers, errors = 8, []
+        start = threading.Barrier(workers)
+
+        def buy():
+            try:
+                start.wait()
+                add_holding(portfolio, fund, purchase_shares(fund, shares=Decimal('1.25')))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(list(Holding.objects.values_list('fund_id', 'shares')), [(fund.id, Decimal('1.25') * workers)])
+
+
+
+class PurchaseTests(TestCase):
+    def test_purchases_must_be_positive(self):
+        fund = Fund(ticker='VTI', nav=Decimal('250'))
+        # An explicit share count is never read as a dollar amount, even when it's 0
+        for shares, dollars in [(0, 100), (-1, None), (None, 0), (None, -50), (None, None)]:
+            with self.subTest(shares=shares, dollars=dollars), self.assertRaises(ValueError):
+                purchase_shares(fund, shares=shares, dollars=dollars)
+        self.assertEqual(purchase_shares(fund, shares=Decimal('0.5')), Decimal('0.5'))
+        self.assertEqual(purchase_shares(fund, dollars=Decimal('100')), Decimal('0.4'))
+
+    def test_create_that_loses_the_race_adds_to_the_winners_holding(self):
+        portfolio = Portfolio.objects.create(user=User.objects.create_user('loser'), name='Race')
+        fund = Fund.objects.create(ticker='VTI', nav=Decimal('250'))
+        update = QuerySet.update
+        competitor = []
+
+        def update_then_competitor_inserts(queryset, **kwargs):
+            updated = update(queryset, **kwargs)
+            if not competitor:
+                # Another request creates the holding after our UPDATE found nothing
+                competitor.extend(Holding.objects.bulk_create([Holding(portfolio=portfolio, fund=fund, shares=Decimal('1.5'))]))
+            return updated
+
+        with mock.patch.object(QuerySet, 'update', update_then_competitor_inserts):
+            add_holding(portfolio, fund, Decimal('2'))
+        self.assertEqual(list(Holding.objects.values_list('portfolio_id', 'fund_id', 'shares')), [(portfolio.id, fund.id, Decimal('3.5'))])
+
+
+class BatchHoldingsValidationTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('batcher'))
+
+    def post(self, body):
+        return self.client.post(reverse('batch_holdings'), body, content_type='application/json')
+
+    def test_malformed_bodies_are_rejected(self):
+        for body in ['not json', '[]', '{}', '{"purchases": 5}', '{"purchases": "VTI"}', '{"purchases": {"symbol": "VTI"}}', '{"purchases": [1]}', '{"purchases": [{"symbol": "VTI", "shares": 1}, null]}']:
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        self.assertFalse(Holding.objects.exists())
+
+    def test_invalid_purchase_is_reported_by_number(self):
+        response = self.post({'purchases': [{'symbol': 'VTI', 'shares': 1}, {'symbol': 'VXUS'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Purchase 2: invalid')
+
+    def test_purchases_are_applied(self):
+        Fund.objects.create(ticker='VTI', nav=Decimal('250'))
+        response = self.post({'purchases': [{'symbol': 'VTI', 'shares': '1.5'}, {'symbol': 'vti', 'dollars_invested': '500'}]})
+        self.assertEqual(response.json(), {'applied': 2})
+        self.assertEqual(Holding.objects.get().shares, Decimal('3.5'))
+
+    def test_dollars_for_a_fund_without_nav_rolls_back_and_is_logged(self):
+        Fund.objects.create(ticker='VTI', nav=Decimal('250'))
+        Fund.objects.create(ticker='NEW')
+        with self.assertLogs('financeapp.views', 'ERROR'):
+            response = self.post({'purchases': [{'symbol': 'VTI', 'shares': 1}, {'symbol': 'NEW', 'dollars_invested': 100}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('NEW has no NAV yet', response.json()['error'])
+        self.assertFalse(Holding.objects.exists())
+
+
+OFX_STATEMENT = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20250103120000<TRNAMT>-42.10<NAME>Grocer</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250104<TRNAMT>2500.00<NAME>Payroll</STMTTRN>
+<STMTTRN><TRNTYPE>DEP<DTPOSTED>20250105<TRNAMT>-0.00<NAME>Odd deposit</STMTTRN>
+<STMTTRN><TRNTYPE>POS<DTPOSTED>20250106<TRNAMT>+15.00<NAME>Refund</STMTTRN>
+<STMTTRN><TRNTYPE>POS<DTPOSTED>20250107<TRNAMT>-9.99<NAME>Streaming</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+class ExpenseImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('importer')
+
+    def test_ofx_imports_debits_and_skips_credits(self):
+        rows = list(read_ofx(OFX_STATEMENT.splitlines(keepends=True)))
+        self.assertEqual([(r['date'], r['item'], r['amount']) for r in rows], [('2025-01-03', 'Grocer', '42.10'), ('2025-01-07', 'Streaming', '9.99')])
+
+    def test_unreadable_csv_is_reported(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('expenses.csv', b'date,item,amount\n2025-01-01,"' + b'x' * 200000 + b'",1\n')
+        response = self.client.post(reverse('import_expenses'), {'file': upload, 'category': 'Want'})
+        self.assertRedirects(response, reverse('budget'), fetch_redirect_response=False)
+        self.assertIn('field larger than field limit', ' '.join(m.message for m in get_messages(response.wsgi_request)))
+        self.assertFalse(BudgetItem.objects.exists())
+
+
+class IngestFundsTests(TestCase):
+    def ingest(self, *records):
+        return list(ingest_funds(records))
+
+    def test_partial_records_keep_stored_fields(self):
+        self.ingest({'ticker': 'VTI', 'name': 'Total Market', 'nav': 250.5, 'as_of': '2025-01-02', 'domestic': 100,
+                     'regions': {'United States': 100}, 'sectors': {'Technology': 30}})
+        # Allocations only, next to a record with a nav so the chunk's field sets differ
+        self.ingest({'ticker': 'VTI', 'international': 0, 'sectors': {'Technology': 32}},
+                    {'ticker': 'BND', 'nav': 72.1, 'as_of': '2025-01-03'})
+        vti = Fund.objects.get(ticker='VTI')
+        self.assertEqual((vti.name, vti.nav, vti.domestic), ('Total Market', Decimal('250.5'), Decimal('100')))
+        self.assertEqual(vti.last_updated, datetime.date(2025, 1, 2))
+        self.assertEqual(dict(vti.sector_allocations.values_list('sector', 'percentage')), {'Technology': Decimal('32')})
+        self.assertEqual(list(vti.region_allocations.values_list('region', flat=True)), ['United States'])
+        self.assertEqual(Fund.objects.get(ticker='BND').last_updated, datetime.date(2025, 1, 3))
+
+    def test_nav_without_as_of_is_dated_today(self):
+        self.ingest({'ticker': 'VXUS', 'name': 'Total International'})
+        self.ingest({'ticker': 'VXUS', 'nav': 63})
+        self.assertEqual(Fund.objects.get(ticker='VXUS').last_updated, datetime.date.today())
+
+    def test_ticker_only_record(self):
+        self.ingest({'ticker': 'VT', 'name': 'Total World'}, {'ticker': 'NEW'})
+        self.ingest({'ticker': 'VT'})
+        self.assertEqual(dict(Fund.objects.values_list('ticker', 'name')), {'VT': 'Total World', 'NEW': None})
+
+
+class HungProvider(providers.StaticProvider):
+    """StaticProvider whose calls block until ``release`` is set."""
+    batch_size = 1
+    max_workers = 2
+
+    def __init__(self, prices, **kwargs):
+        super().__init__(prices, **kwargs)
+        self.release = threading.Event()
+        self.started = 0
+
+    def fetch_batch(self, tickers):
+        self.started += 1
+        self.release.wait(5)
+        return super().fetch_batch(tickers)
+
+
+class AsyncFetchTests(SimpleTestCase):
+    def setUp(self):
+        self.provider = HungProvider({'AAA': 1, 'BBB': 2, 'CCC': 3, 'DDD': 4})
+        self.addCleanup(self.provider.release.set)
+
+    def abandoned(self):
+        with providers._abandoned_lock:
+            return providers._abandoned[self.provider.upstream]
+
+    async def test_timed_out_batches_hold_back_later_calls_until_they_finish(self):
+        with self.assertLogs('financeapp.providers', 'WARNING'):
+            self.assertEqual(await self.provider.afetch_many(['AAA', 'BBB', 'CCC', 'DDD'], timeout=0.1), {})
+        # Two batches were running and are left behind; the two queued ones never start
+        self.assertEqual(self.abandoned(), 2)
+
+        start = time.monotonic()
+        with self.assertLogs('financeapp.providers', 'WARNING') as logs:
+            self.assertEqual(await self.provider.afetch_many(['AAA'], timeout=1), {})
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertIn('skipped 1 of 1 batches', logs.output[0])
+
+        self.provider.release.set()
+        for _ in range(50):
+            if not self.abandoned():
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.provider.started, 2)
+        self.assertEqual(await self.provider.afetch_many(['AAA', 'BBB'], timeout=1), {'AAA': providers.Quote(Decimal(1)), 'BBB': providers.Quote(Decimal(2))})
+
+    async def test_cancelling_the_caller_cancels_its_batches(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.provider.afetch_many(['AAA', 'BBB', 'CCC']), 0.1)
+        self.assertEqual(self.abandoned(), 2)
+        self.provider.release.set()
+        await asyncio.sleep(0.1)
+        self.assertEqual((self.provider.started, self.abandoned()), (2, 0))
+
+    async def test_failed_batches_are_logged(self):
+        self.provider.release.set()
+        self.provider.prices = None  # every batch raises TypeError
+        with self.assertLogs('financeapp.providers', 'ERROR') as logs:
+            self.assertEqual(await self.provider.afetch_many(['AAA']), {})
+        self.assertIn('HungProvider failed for AAA', logs.output[0])
+
+
+class SnapshotRaceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.portfolio = Portfolio.objects.create(user=User.objects.create_user('snapper'), name='Snap')
+        cls.fund = Fund.objects.create(ticker='VTI', nav=Decimal('100'))
+        Holding.objects.create(portfolio=cls.portfolio, fund=cls.fund, shares=Decimal('1'))
+
+    def race(self, change):
+        """get_snapshot, with ``change`` made after it has loaded the holdings."""
+        load = snapshots._holdings
+
+        def holdings_then_change(portfolio_ids):
+            holdings = list(load(portfolio_ids))
+            change()
+            return holdings
+        with mock.patch.object(snapshots, '_holdings', holdings_then_change):
+            return snapshots.get_snapshot(self.portfolio)
+
+    def test_change_during_first_recompute_leaves_snapshot_dirty(self):
+        def buy():
+            Holding.objects.filter(portfolio=self.portfolio).update(shares=Decimal('3'))
+            snapshots.mark_dirty([self.portfolio.id])
+        self.assertEqual(self.race(buy).total_value, Decimal('100'))
+        self.assertTrue(PortfolioSnapshot.objects.get(portfolio=self.portfolio).dirty)
+        self.assertEqual(snapshots.get_snapshot(self.portfolio).total_value, Decimal('300'))
+        self.assertFalse(PortfolioSnapshot.objects.get(portfolio=self.portfolio).dirty)
+
+    def test_change_during_recompute_of_dirty_snapshot_keeps_it_dirty(self):
+        snapshots.get_snapshot(self.portfolio)
+        snapshots.mark_dirty(fund_ids=[self.fund.id])
+
+        def reprice():
+            Fund.objects.filter(id=self.fund.id).update(nav=Decimal('110'))
+            snapshots.mark_dirty(fund_ids=[self.fund.id])
+        self.race(reprice)
+        self.assertTrue(PortfolioSnapshot.objects.get(portfolio=self.portfolio).dirty)
+        self.assertEqual(snapshots.get_snapshot(self.portfolio).total_value, Decimal('110'))
+
+    def test_clean_snapshot_is_served_from_the_row(self):
+        snapshots.get_snapshot(self.portfolio)
+        with self.assertNumQueries(1):
+            self.assertEqual(snapshots.get_snapshot(self.portfolio).total_value, Decimal('100'))
+
+
+@override_settings(FINANCEAPP_CIRCUIT_FAILURES=3, FINANCEAPP_CIRCUIT_RESET=30, FINANCEAPP_UNKNOWN_TICKER_TTL=3600, FINANCEAPP_LOOKUP_ERROR_TTL=45)
+class FaultInjectionTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        resilience._breakers.clear()
+        self.faulty = providers.FaultyProvider(batch_size=1)
+        self.provider = providers.ResilientProvider(self.faulty)
+        self.clock = 1000.0
+        patcher = mock.patch.object(resilience.time, 'monotonic', lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, *tickers):
+        with self.assertNoLogs('financeapp.providers') if self.faulty.healthy else self.assertLogs('financeapp.providers', 'ERROR'):
+            return self.provider.fetch_many(tickers)
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        self.faulty.healthy = False
+        self.assertEqual(self.fetch('VT', 'VTI', 'VOO'), {})
+        self.assertEqual((self.provider.breaker.state, self.faulty.calls), (resilience.OPEN, 3))
+        # Open: callers fall back at once without calling upstream
+        self.faulty.healthy = True
+        self.assertEqual(self.provider.fetch_many(['VXUS', 'BND']), {})
+        self.assertEqual(self.faulty.calls, 3)
+
+    def test_half_open_probe_closes_or_reopens_the_breaker(self):
+        self.faulty.healthy = False
+        self.fetch('VT', 'VTI', 'VOO')
+        self.clock += 30
+        # One probe goes through and fails, which opens the breaker again straight away
+        self.fetch('VXUS')
+        self.assertEqual((self.provider.breaker.state, self.faulty.calls), (resilience.OPEN, 4))
+        self.assertEqual(self.provider.fetch_many(['BND']), {})
+        self.assertEqual(self.faulty.calls, 4)
+
+        self.clock += 30
+        self.faulty.healthy = True
+        self.assertEqual(self.fetch('BND'), {'BND': providers.Quote(Decimal('73.64'))})
+        self.assertEqual(self.provider.breaker.state, resilience.CLOSED)
+        self.assertEqual(self.fetch('VEA'), {'VEA': providers.Quote(Decimal('55.31'))})
+
+    def test_provider_without_history_leaves_the_probe_alone(self):
+        self.faulty.healthy = False
+        self.fetch('VT', 'VTI', 'VOO')
+        self.clock += 30
+        with self.assertRaises(NotImplementedError):
+            self.provider.fetch_history(['VT'], datetime.date(2025, 1, 2))
+        self.assertEqual(self.provider.breaker.state, resilience.OPEN)
+        # The next call is still the probe
+        self.faulty.healthy = True
+        self.assertEqual(self.fetch('BND'), {'BND': providers.Quote(Decimal('73.64'))})
+        self.assertEqual(self.provider.breaker.state, resilience.CLOSED)
+
+    def test_failed_and_unknown_tickers_are_cached_with_their_ttls(self):
+        with mock.patch.object(resilience, 'cache', mock.Mock(wraps=cache)) as spy:
+            self.faulty.healthy = False
+            self.fetch('VT')
+            self.faulty.healthy = True
+            self.fetch('NOPE')
+        self.assertEqual(spy.set_many.call_args_list, [
+            mock.call({resilience._key('VT'): resilience.ERROR}, timeout=45),
+            mock.call({resilience._key('NOPE'): resilience.UNKNOWN}, timeout=3600),
+        ])
+        # Both are skipped until their entries expire, without calling upstream
+        calls = self.faulty.calls
+        self.assertEqual(self.fetch('VT', 'NOPE'), {})
+        self.assertEqual(self.faulty.calls, calls)
+        resilience.forget(['VT'])
+        self.assertEqual(self.fetch('VT'), {'VT': providers.Quote(Decimal('128.42'))})
+
+    def test_empty_multi_ticker_batch_counts_as_a_failure(self):
+        provider = providers.ResilientProvider(providers.FaultyProvider(batch_size=10))
+        self.assertEqual(provider.fetch_many(['NOPE1', 'NOPE2']), {})
+        self.assertEqual(provider.breaker.failures, 1)
+        self.assertEqual(resilience.negative_entries(['NOPE1', 'NOPE2']), {'NOPE1': resilience.ERROR, 'NOPE2': resilience.ERROR})
+
+    @override_settings(FINANCEAPP_CIRCUIT_FAILURES=100)
+    def test_random_failures_still_price_what_they_can(self):
+        provider = providers.ResilientProvider(providers.FaultyProvider(failure_rate=0.3, seed=7, batch_size=1))
+        tickers = ['VT', 'VXUS', 'VTI', 'VOO', 'VEA', 'VWO', 'BND', 'BNDX']
+        with self.assertLogs('financeapp.providers', 'ERROR') as logs:
+            prices = provider.fetch_many(tickers)
+        self.assertEqual(len(prices) + len(logs.output), len(tickers))
+
+
+class RefreshFundsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        portfolio = Portfolio.objects.create(user=User.objects.create_user('holder'), name='Held')
+        old = datetime.date(2025, 1, 2)
+        cls.vti = Fund.objects.create(ticker='VTI', nav=Decimal('300'), last_updated=old)
+        cls.gone = Fund.objects.create(ticker='GONE', nav=Decimal('10'), last_updated=old)
+        cls.unheld = Fund.objects.create(ticker='IDLE', nav=Decimal('5'), last_updated=old)
+        for fund in (cls.vti, cls.gone):
+            Holding.objects.create(portfolio=portfolio, fund=fund, shares=Decimal('1'))
+
+    def setUp(self):
+        cache.clear()
+        performance._series.clear()
+
+    def test_stale_held_funds_are_refreshed_and_priced(self):
+        as_of = datetime.date(2025, 1, 6)
+        provider = providers.StaticProvider({'vti': 312.57, 'IDLE': 6})
+        refreshed, failed = refresh_funds(provider, stale_funds(as_of), as_of=as_of)
+        self.assertEqual((refreshed, failed), (['VTI'], ['GONE']))
+        self.vti.refresh_from_db()
+        self.assertEqual((self.vti.nav, self.vti.last_updated), (Decimal('312.57'), as_of))
+        self.assertEqual(list(FundPrice.objects.values_list('fund__ticker', 'date', 'nav')), [('VTI', as_of, Decimal('312.57'))])
+        # A fund that failed keeps its last NAV and stays stale; one nobody holds was never asked for
+        self.assertEqual(list(stale_funds(as_of).filter(ticker__in=['VTI', 'GONE', 'IDLE']).values_list('ticker', flat=True)), ['GONE'])
+        self.assertEqual(Fund.objects.get(ticker='IDLE').nav, Decimal('5'))
+
+    def test_prices_are_kept_under_the_day_they_were_quoted_for(self):
+        friday, monday = datetime.date(2025, 1, 3), datetime.date(2025, 1, 6)
+        provider = providers.StaticProvider({'VTI': 310, 'GONE': 11}, as_of=friday)
+        self.assertEqual(refresh_funds(provider, stale_funds(monday), as_of=monday), (['GONE', 'VTI'], []))
+        self.assertEqual(sorted(FundPrice.objects.values_list('fund__ticker', 'date', 'nav')), [('GONE', friday, Decimal('11')), ('VTI', friday, Decimal('310'))])
+        self.assertEqual(Fund.objects.get(ticker='VTI').last_updated, friday)
+        # No close for Monday yet, so both are still stale for it
+        self.assertEqual(sorted(stale_funds(monday).filter(ticker__in=['VTI', 'GONE']).values_list('ticker', flat=True)), ['GONE', 'VTI'])
+
+    def test_yfinance_quotes_the_day_of_each_funds_last_close(self):
+        import pandas as pd
+
+        days = pd.to_datetime(['2025-01-02', '2025-01-03'])
+        closes = pd.DataFrame({('Close', 'VTI'): [300.123456, 301.5], ('Close', 'VXUS'): [60.25, float('nan')]}, index=days)
+        yfinance = mock.Mock(download=mock.Mock(return_value=closes))
+        with mock.patch.dict('sys.modules', yfinance=yfinance):
+            quotes = providers.YFinanceProvider().fetch_batch(['VTI', 'VXUS', 'NOPE'])
+        self.assertEqual(quotes, {
+            'VTI': providers.Quote(Decimal('301.5'), datetime.date(2025, 1, 3)),
+            'VXUS': providers.Quote(Decimal('60.25'), datetime.date(2025, 1, 2)),
+        })
+
+    async def test_async_refresh(self):
+        friday, monday = datetime.date(2025, 1, 3), datetime.date(2025, 1, 6)
+        provider = providers.StaticProvider({'VTI': 305, 'IDLE': 6}, as_of=friday)
+        refreshed, failed = await arefresh_funds(provider, [self.vti, self.gone], as_of=monday, timeout=1)
+        self.assertEqual((refreshed, failed), (['VTI'], ['GONE']))
+        vti = await Fund.objects.aget(ticker='VTI')
+        self.assertEqual((vti.nav, vti.last_updated), (Decimal('305'), friday))
+        self.assertEqual([price async for price in FundPrice.objects.values_list('fund__ticker', 'date', 'nav')], [('VTI', friday, Decimal('305'))])
+        self.assertEqual((await Fund.objects.aget(ticker='GONE')).nav, Decimal('10'))
+
+    def test_provider_outage_keeps_last_navs(self):
+        provider = providers.StaticProvider({'VTI': 1})
+        with mock.patch.object(provider, 'fetch_many', side_effect=ConnectionError('down')):
+            with self.assertLogs('financeapp.refresh', 'ERROR'):
+                refreshed, failed = refresh_funds(provider, [self.vti, self.gone])
+        self.assertEqual((refreshed, sorted(failed)), ([], ['GONE', 'VTI']))
+        self.assertEqual(Fund.objects.get(ticker='VTI').nav, Decimal('300'))
+        self.assertFalse(FundPrice.objects.exists())
+
+    @override_settings(FINANCEAPP_PRICE_PROVIDER='financeapp.providers.StaticProvider', FINANCEAPP_PRICE_PROVIDER_OPTIONS={'prices': {'VTI': 312.57}})
+    def test_refresh_navs_command(self):
+        resilience._breakers.clear()
+        out = io.StringIO()
+        call_command('refresh_navs', stdout=out)
+        self.assertIn('Refreshed 1 fund(s)', out.getvalue())
+        self.assertIn('No price for: GONE', out.getvalue())
+        self.assertEqual(Fund.objects.get(ticker='VTI').last_updated, last_trading_day())
+        # GONE is now in the negative cache, so the next pass doesn't ask upstream for it
+        self.assertEqual(resilience.negative_entries(['GONE']), {'GONE': resilience.UNKNOWN})
+
+    def test_last_trading_day_skips_weekends(self):
+        self.assertEqual(last_trading_day(datetime.date(2025, 1, 5)), datetime.date(2025, 1, 3))
+        self.assertEqual(last_trading_day(datetime.date(2025, 1, 6)), datetime.date(2025, 1, 6))
+
+
+class FundIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vti = Fund.objects.create(ticker='VTI', name='Vanguard Total Stock Market', isin='US9229087690')
+        cls.vxus = Fund.objects.create(ticker='VXUS', name='Vanguard Total International Stock')
+
+    def setUp(self):
+        self.index = FundIndex()
+        self.index.build()
+
+    def tickers(self, query):
+        return [fund['ticker'] for fund in self.index.search(query)]
+
+    def test_prefix_and_fuzzy_search(self):
+        self.assertEqual(self.tickers('vt'), ['VTI'])
+        self.assertEqual(self.tickers('total'), ['VTI', 'VXUS'])
+        self.assertEqual(self.tickers('international st'), ['VXUS'])
+        self.assertEqual(self.tickers('US92'), ['VTI'])
+        self.assertEqual(self.tickers('VXSU'), ['VXUS'])
+
+    def test_incremental_update(self):
+        self.vti.name = 'Vanguard Total Market'
+        self.index.update([self.vti, Fund(id=999, ticker='BND', name='Vanguard Total Bond')], removed=[self.vxus.id])
+        self.assertEqual(self.tickers('total'), ['BND', 'VTI'])
+        self.assertEqual(self.tickers('stock'), [])
+
+    def test_typos_are_matched_within_a_letter_of_length(self):
+        self.index.update([Fund(id=998, ticker='VT', name='World'), Fund(id=999, ticker='AVTI', name='Avantis')])
+        self.assertEqual(self.tickers('VTII'), ['VTI'])
+        self.assertEqual(self.tickers('VXUSS'), ['VXUS'])
+        self.assertEqual(self.index.close_tickers('VTX'), ['VT', 'VTI'])
+        # Only tickers starting with the same letter are candidates
+        self.assertEqual(self.index.close_tickers('XVTI'), [])
+        self.index.update(removed=[self.vti.id])
+        self.assertEqual(self.tickers('VTII'), [])
+        self.assertNotIn('VTI', self.index.tickers[('V', 3)])
+
+    def test_warm_index(self):
+        index = FundIndex()
+        with mock.patch.object(search, 'fund_index', index), mock.patch.object(search, 'connections') as connections:
+            search.warm_index()
+            self.assertTrue(index.built)
+            connections.close_all.assert_called_once_with()
+            with self.assertNumQueries(0):
+                self.assertEqual([fund['ticker'] for fund in index.search('vxus')], ['VXUS'])
+
+            with override_settings(FINANCEAPP_SEARCH_WARMUP=False):
+                index = search.fund_index = FundIndex()
+                search.warm_index()
+            self.assertFalse(index.built)
+
+            with mock.patch.object(index, 'build', side_effect=DatabaseError('no such table')), self.assertLogs('financeapp.search', 'WARNING'):
+                search.warm_index()
+            self.assertFalse(index.built)
+
+    def test_drift_falls_back_to_a_rebuild(self):
+        # Entries that went missing behind the index's back, e.g. a term past the end of the list
+        del self.index.terms[-1], self.index.entries[-1]
+        self.index.update(removed=[self.vti.id, self.vxus.id])
+        self.assertFalse(self.index.built)
+        self.assertEqual(self.tickers('total'), ['VTI', 'VXUS'])
+
+
+class BudgetConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('returning')
+        Portfolio.objects.create(user=user, name='Mine')
+        self.client.force_login(user)
+        # The first visit sets the CSRF cookie, which is part of the version
+        self.client.get(reverse('budget'))
+        self.etag = self.client.get(reverse('budget'))['ETag']
+
+    def test_unchanged_page_is_not_modified(self):
+        self.assertEqual(self.client.get(reverse('budget'), HTTP_IF_NONE_MATCH=self.etag).status_code, 304)
+
+    def test_default_year_page_changes_at_new_year(self):
+        next_year = datetime.date(timezone.localdate().year + 1, 1, 1)
+        with mock.patch.object(timezone, 'localdate', return_value=next_year):
+            response = self.client.get(reverse('budget'), HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['year'], next_year.year)
+
+
+class BenchmarkInvalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vt = Fund.objects.create(ticker='VT', nav=Decimal('128'))
+        cls.other = Fund.objects.create(ticker='VTI', nav=Decimal('300'))
+        RegionAllocation.objects.create(fund=cls.vt, region='United States', percentage=Decimal('62'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_allocation_change_invalidates_benchmark_without_loading_the_fund(self):
+        self.assertEqual(get_benchmarks(['VT'])['VT']['regions'], {'United States': Decimal('62')})
+        # Insert, benchmark id map, snapshot and page version bumps; never the row's fund
+        with self.assertNumQueries(4):
+            RegionAllocation.objects.create(fund_id=self.vt.id, region='Europe', percentage=Decimal('16'))
+        # The id map is cached from then on
+        with self.assertNumQueries(3):
+            SectorAllocation.objects.create(fund_id=self.other.id, sector='Technology', percentage=Decimal('30'))
+        self.assertEqual(get_benchmarks(['VT'])['VT']['regions'], {'United States': Decimal('62'), 'Europe': Decimal('16')})
+
+    def test_new_benchmark_fund_is_picked_up(self):
+        # Map the benchmark ids while VXUS doesn't exist yet
+        SectorAllocation.objects.create(fund_id=self.vt.id, sector='Technology', percentage=Decimal('25'))
+        with self.captureOnCommitCallbacks(execute=True):
+            vxus = Fund.objects.create(ticker='VXUS', nav=Decimal('68'))
+        get_benchmarks(['VXUS'])
+        RegionAllocation.objects.create(fund_id=vxus.id, region='Europe', percentage=Decimal('38'))
+        self.assertEqual(get_benchmarks(['VXUS'])['VXUS']['regions'], {'Europe': Decimal('38')})
+
+
+@override_settings(FINANCEAPP_METRICS_TOKEN='secret')
+class MetricsViewTests(TestCase):
+    def scrape(self):
+        return self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    def test_single_process_exports_this_process(self):
+        self.assertContains(self.scrape(), 'financeapp_circuit_state')
+
+    def test_multiprocess_mode_reads_the_shared_directory(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+            response = self.scrape()
+        # Nothing has been written to the new directory yet, so no worker's samples show up
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'financeapp_circuit_state')
+
+
+@override_settings(FINANCEAPP_RESILIENT_PROVIDER=False)
+class PortfolioLiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('live')
+        portfolio = Portfolio.objects.create(user=cls.user, name='Live')
+        cls.vt = Fund.objects.create(ticker='VT', nav=Decimal('100'), last_updated=datetime.date(2025, 1, 2))
+        Fund.objects.create(ticker='VXUS', nav=Decimal('60'), last_updated=datetime.date(2099, 1, 1))
+        Holding.objects.create(portfolio=portfolio, fund=cls.vt, shares=Decimal('2'))
+
+    def setUp(self):
+        cache.clear()
+        performance._series.clear()
+
+    @override_settings(FINANCEAPP_PRICE_PROVIDER='financeapp.providers.StaticProvider', FINANCEAPP_PRICE_PROVIDER_OPTIONS={'prices': {'VT': 110}})
+    async def test_stale_funds_are_repriced_before_rendering(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('portfolio_live'))
+        self.assertContains(response, '220.00')
+        vt = await Fund.objects.aget(id=self.vt.id)
+        self.assertEqual((vt.nav, vt.last_updated), (Decimal('110'), last_trading_day()))
+        self.assertTrue(await FundPrice.objects.filter(fund=vt, nav=Decimal('110')).aexists())
+
+    @override_settings(FINANCEAPP_PRICE_PROVIDER='financeapp.providers.SlowProvider', FINANCEAPP_PRICE_PROVIDER_OPTIONS={'delay': 1}, FINANCEAPP_LIVE_REFRESH_TIMEOUT=0.05)
+    async def test_slow_provider_renders_the_last_navs(self):
+        await self.async_client.aforce_login(self.user)
+        start = time.monotonic()
+        with self.assertLogs('financeapp.providers', 'WARNING'):
+            response = await self.async_client.get(reverse('portfolio_live'))
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertContains(response, '200.00')
+        self.assertEqual((await Fund.objects.aget(id=self.vt.id)).nav, Decimal('100'))
+
+    async def test_requires_login(self):
+        response = await self.async_client.get(reverse('portfolio_live'))
+        self.assertEqual(response.status_code, 302)
+
+
+@modify_settings(MIDDLEWARE={'append': 'financeapp.metrics.PerformanceMiddleware'})
+@override_settings(FINANCEAPP_SERVER_TIMING=True, FINANCEAPP_METRICS_SAMPLE_RATE=1.0)
+class PerformanceMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('timed')
+        portfolio = Portfolio.objects.create(user=cls.user, name='Timed')
+        for ticker in ('VT', 'VXUS'):
+            Holding.objects.create(portfolio=portfolio, fund=Fund.objects.create(ticker=ticker, nav=Decimal('100')), shares=Decimal('1'))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_nested_blocks_and_queries_are_not_counted_twice(self):
+        stats = metrics.RequestStats()
+        token = metrics._current.set(stats)
+        try:
+            with metrics.timed('render'):
+                time.sleep(0.01)
+                with metrics.timed('holding_exposures'):
+                    time.sleep(0.05)
+                time.sleep(0.05)
+                stats.db_time += 0.05  # as if a query had taken that long
+        finally:
+            metrics._current.reset(token)
+        self.assertGreaterEqual(stats.timings['holding_exposures'], 0.05)
+        self.assertGreaterEqual(stats.timings['render'], 0.01)
+        self.assertLess(stats.timings['render'], 0.05)
+
+    def test_server_timing_and_request_metrics(self):
+        labels = {'view': 'portfolio'}
+        requests = REGISTRY.get_sample_value('financeapp_request_seconds_count', labels) or 0
+        queries = REGISTRY.get_sample_value('financeapp_request_queries_sum', labels) or 0
+
+        response = self.client.get(reverse('portfolio'))
+        entries = {entry.split(';')[0]: dict(part.split('=', 1) for part in entry.split(';')[1:]) for entry in response['Server-Timing'].split(', ')}
+        self.assertLessEqual({'db', 'cache', 'holding_exposures', 'render', 'total'}, set(entries))
+        count = int(entries['db']['desc'].strip('"').split()[0])
+        self.assertGreater(count, 0)
+        # The tables are built during the render, but their queries and exposures aren't billed to it
+        durations = {name: float(entry['dur']) for name, entry in entries.items() if 'dur' in entry}
+        self.assertLessEqual(durations['db'] + durations['holding_exposures'] + durations['render'], durations['total'])
+        self.assertEqual(REGISTRY.get_sample_value('financeapp_request_seconds_count', labels), requests + 1)
+        self.assertEqual(REGISTRY.get_sample_value('financeapp_request_queries_sum', labels), queries + count)
+
+    @override_settings(FINANCEAPP_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_left_alone(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('portfolio')))
+
+
+class ProjectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner')
+        cls.portfolio = Portfolio.objects.create(user=cls.user, name='Plan', monthly_income=Decimal('4000'))
+        vti = Fund.objects.create(ticker='VTI', nav=Decimal('300'), domestic=100, large_cap_blend=70, mid_cap_blend=20, small_cap_blend=10)
+        bnd = Fund.objects.create(ticker='BND', nav=Decimal('72'))
+        Holding.objects.create(portfolio=cls.portfolio, fund=vti, shares=Decimal('100'))
+        Holding.objects.create(portfolio=cls.portfolio, fund=bnd, shares=Decimal('200'))
+
+    def holdings(self):
+        return list(self.portfolio.holdings.select_related('fund'))
+
+    def test_seed_reproduces_results_with_any_worker_count(self):
+        # Three RNG shards, run in-process and spread over two or three worker processes
+        paths = 2 * SHARD_PATHS + 500
+        runs = [project(self.holdings(), 500, years=3, paths=paths, seed=42, workers=workers) for workers in (1, 2, 3)]
+        self.assertEqual(runs[0], runs[1])
+        self.assertEqual(runs[0], runs[2])
+        self.assertEqual(runs[0]['seed'], 42)
+        self.assertNotEqual(runs[0]['percentiles'], project(self.holdings(), 500, years=3, paths=paths, seed=43)['percentiles'])
+
+    def test_unseeded_run_returns_a_seed_that_reproduces_it(self):
+        first = project(self.holdings(), 500, years=2, paths=1000)
+        self.assertEqual(project(self.holdings(), 500, years=2, paths=1000, seed=first['seed']), first)
+
+    def test_bands_and_goal_probability(self):
+        result = project(self.holdings(), 500, years=5, paths=2000, seed=1, goal=60_000)
+        self.assertEqual(result['start_value'], 44_400)
+        self.assertEqual(len(result['years']), 6)
+        self.assertTrue(all(p == result['start_value'] for p in (band[0] for band in result['percentiles'].values())))
+        bands = [result['percentiles'][str(p)] for p in (5, 25, 50, 75, 95)]
+        for lower, upper in zip(bands, bands[1:]):
+            self.assertTrue(all(l <= u for l, u in zip(lower, upper)))
+        self.assertGreaterEqual(result['goal_probability'], 0)
+        self.assertLessEqual(result['goal_probability'], 1)
+        self.assertEqual(project(self.holdings(), 500, years=5, paths=100, seed=1, goal=0)['goal_probability'], 1.0)
+        self.assertEqual(project(self.holdings(), 500, years=5, paths=100, seed=1, goal=1e12)['goal_probability'], 0.0)
+
+    def test_nothing_to_project(self):
+        self.assertIsNone(project([], 0))
+
+
+class ProjectionViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('nobody')
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        return self.client.get(reverse('projection'), params)
+
+    def test_user_without_portfolio(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Add holdings or savings to project.'})
+        self.assertTrue(Portfolio.objects.filter(user=self.user).exists())
+        self.assertEqual(self.get(contribution=100, years=2, paths=10, seed=3).json()['monthly_contribution'], 100)
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in [{'seed': -1}, {'seed': 'x'}, {'years': 0}, {'years': MAX_YEARS + 1}, {'paths': 0},
+                       {'paths': MAX_PATHS + 1}, {'goal': 'nan'}, {'contribution': 'inf'}]:
+            with self.subTest(**params):
+                response = self.get(**{'contribution': 100, **params})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_limits_are_inclusive(self):
+        response = self.get(contribution=100, years=MAX_YEARS, paths=10, seed=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['years']), MAX_YEARS + 1)
+
+
+class PortfolioPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('viewer')
+        cls.portfolio = Portfolio.objects.create(user=cls.user, name='Mine')
+        for ticker in ('VT', 'VXUS'):
+            Fund.objects.create(ticker=ticker, nav=Decimal('100'))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_unpriced_fund_counts_as_zero(self):
+        Holding.objects.create(portfolio=self.portfolio, fund=Fund.objects.create(ticker='VTI', nav=Decimal('250')), shares=Decimal('2'))
+        Holding.objects.create(portfolio=self.portfolio, fund=Fund.objects.create(ticker='NEW'), shares=Decimal('5'))
+        response = self.client.get(reverse('portfolio'))
+        self.assertEqual(response.status_code, 200)
+        holdings = response.context['holdings']()  # lazy_context entry
+        self.assertEqual({h.fund.ticker: (h.dollars_invested, h.percent) for h in holdings},
+                         {'VTI': ('500.00', Decimal('100.00')), 'NEW': ('0.00', Decimal('0.00'))})
+
+    def test_portfolio_worth_nothing(self):
+        Holding.objects.create(portfolio=self.portfolio, fund=Fund.objects.create(ticker='NEW'), shares=Decimal('5'))
+        response = self.client.get(reverse('portfolio'))
+        self.assertEqual([h.percent for h in response.context['holdings']()], [0])
+
+    def test_non_positive_purchases_are_refused(self):
+        Fund.objects.create(ticker='VTI', nav=Decimal('250'))
+        with self.assertLogs('financeapp.views', 'ERROR'):
+            response = self.client.post(reverse('portfolio'), {'symbol': 'VTI', 'shares': '-2'}, follow=True)
+        self.assertIn('Shares must be more than 0', ' '.join(m.message for m in response.context['messages']))
+        self.assertFalse(Holding.objects.exists())
+
+    def test_query_count_does_not_grow_with_holdings(self):
+        for count in (1, 8):
+            with self.subTest(holdings=count):
+                user = User.objects.create_user(f'holder{count}')
+                portfolio = Portfolio.objects.create(user=user, name='Many')
+                Holding.objects.bulk_create([
+                    Holding(portfolio=portfolio, fund=Fund.objects.create(ticker=f'F{count}X{i}', nav=Decimal('10')), shares=Decimal('1'))
+                    for i in range(count)
+                ])
+                self.client.force_login(user)
+                # Sets the CSRF cookie (part of the fragment's key) and computes the snapshot
+                self.client.get(reverse('portfolio'))
+                cache.clear()
+                # Session, user, portfolio, holdings with funds, benchmark fund, its regions and sectors, snapshot
+                with self.assertNumQueries(8):
+                    response = self.client.get(reverse('portfolio'))
+                self.assertContains(response, f'F{count}X0')
+                # Only session, user and portfolio once the tables come from the fragment cache
+                with self.assertNumQueries(3):
+                    self.client.get(reverse('portfolio'))
+
+
+class RebalanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        funds = {
+            'VT': ('100', {'United States': '60', 'Europe': '40'}, {'Technology': '50', 'Financials': '50'}, {'large_cap_blend': '100'}),
+            'VXUS': ('50', {'Europe': '100'}, {'Financials': '100'}, {'large_cap_value': '100'}),
+            'VTI': ('250', {'United States': '100'}, {'Technology': '100'}, {'large_cap_growth': '100'}),
+            'VGK': ('70', {'Europe': '100'}, {'Financials': '60', 'Industrials': '40'}, {'mid_cap_value': '100'}),
+            'BND': ('72', {}, {}, {}),
+        }
+        cls.funds = []
+        for ticker, (nav, regions, sectors, caps) in funds.items():
+            fund = Fund.objects.create(ticker=ticker, nav=Decimal(nav), **{attr: Decimal(p) for attr, p in caps.items()})
+            RegionAllocation.objects.bulk_create([RegionAllocation(fund=fund, region=r, percentage=Decimal(p)) for r, p in regions.items()])
+            SectorAllocation.objects.bulk_create([SectorAllocation(fund=fund, sector=s, percentage=Decimal(p)) for s, p in sectors.items()])
+            cls.funds.append(fund)
+        cls.user = User.objects.create_user('rebalancer')
+        cls.portfolio = Portfolio.objects.create(user=cls.user, name='Lopsided')
+        Holding.objects.bulk_create([Holding(portfolio=cls.portfolio, fund=cls.funds[2], shares=Decimal('8')), Holding(portfolio=cls.portfolio, fund=cls.funds[4], shares=Decimal('10'))])
+
+    def setUp(self):
+        cache.clear()
+        funds = Fund.objects.prefetch_related('region_allocations', 'sector_allocations').order_by('id')
+        self.problem = Problem(funds, get_benchmarks(['VT'])['VT'])
+        # 8 VTI and 10 BND: all US tech, plus bonds
+        self.current = np.array([0, 0, 2000, 0, 720], dtype=float)
+
+    def test_invariants(self):
+        for allow_sell in (False, True):
+            for cash in (0.0, 1000.0):
+                with self.subTest(allow_sell=allow_sell, cash=cash):
+                    proposed = self.problem.solve(self.current, cash, allow_sell)
+                    self.assertAlmostEqual(proposed.sum(), self.current.sum() + cash, places=6)
+                    self.assertTrue((proposed >= -1e-9).all())
+                    if not allow_sell:
+                        self.assertTrue((proposed >= self.current - 1e-6).all())
+                    self.assertLessEqual(self.problem.distance(proposed), self.problem.distance(self.current) + 1e-9)
+
+    def test_max_trades(self):
+        for max_trades in (1, 2):
+            with self.subTest(max_trades=max_trades):
+                proposed = self.problem.solve(self.current, 1000.0, max_trades=max_trades)
+                self.assertLessEqual(int((proposed - self.current >= MIN_TRADE).sum()), max_trades)
+                self.assertAlmostEqual(proposed.sum(), self.current.sum() + 1000, places=6)
+
+    def test_the_benchmark_alone_is_on_target(self):
+        proposed = self.problem.solve(np.zeros(5), 1000.0, max_trades=1)
+        self.assertAlmostEqual(proposed[0], 1000, places=4)
+        self.assertAlmostEqual(self.problem.distance(proposed), 0, places=6)
+
+    def test_rebalance_portfolio(self):
+        result = rebalance_portfolio(self.portfolio, cash=1000.0, candidates=['VGK'])
+        self.assertLess(result['distance_after'], result['distance_before'])
+        self.assertTrue(all(trade['trade'] > 0 for trade in result['trades']))
+        self.assertAlmostEqual(sum(trade['trade'] for trade in result['trades']), 1000, delta=0.05)
+        for trade in result['trades']:
+            self.assertAlmostEqual(trade['shares'], trade['trade'] / float(Fund.objects.get(ticker=trade['ticker']).nav), places=3)
+
+    def test_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('rebalance'), {'cash': '1000', 'sell': '1', 'max_trades': '2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'trades', 'distance_before', 'distance_after'})
+        self.assertAlmostEqual(sum(trade['trade'] for trade in response.json()['trades']), 1000, delta=0.05)
+        for params in ({'cash': 'nan'}, {'cash': 'inf'}, {'cash': '-1'}, {'cash': 'lots'}, {'max_trades': '0'}, {'max_trades': '-3'}):
+            with self.subTest(**params):
+                self.assertEqual(self.client.get(reverse('rebalance'), params).status_code, 400)
+
+
+class ExportTests(TestCase):
+    fields = ['id', 'user__username', 'date', 'item', 'category', 'subcategory', 'amount']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('exporter')
+        other = User.objects.create_user('someone_else')
+        BudgetItem.objects.bulk_create([
+            BudgetItem(user=user, date=datetime.date(2025, 1 + i % 12, 1), item=f'Item, "{i}"', category='Need', subcategory='Misc', amount=Decimal(f'{i}.{i:02d}'))
+            for i in range(7) for user in (cls.user, other)
+        ])
+
+    def expected(self, user):
+        return [tuple(row) for row in BudgetItem.objects.filter(user=user).order_by('pk').values_list(*self.fields)]
+
+    def read(self, file_format, chunks):
+        if file_format == 'csv':
+            header, *rows = csv.reader(io.StringIO(''.join(chunks)))
+            self.assertEqual(header, self.fields)
+            return [(int(i), username, datetime.date.fromisoformat(date), item, category, subcategory, Decimal(amount))
+                    for i, username, date, item, category, subcategory, amount in rows]
+        if file_format == 'jsonl':
+            rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+            return [(r['id'], r['user__username'], datetime.date.fromisoformat(r['date']), r['item'], r['category'], r['subcategory'], Decimal(r['amount']))
+                    for r in rows]
+        table = pq.read_table(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(table.column_names, self.fields)
+        return [tuple(row[f] for f in self.fields) for row in table.to_pylist()]
+
+    def test_round_trip(self):
+        empty = User.objects.create_user('nobody')
+        for file_format in FORMATS:
+            for user in (self.user, empty):
+                with self.subTest(file_format=file_format, user=user.username):
+                    self.assertEqual(self.read(file_format, list(export_stream('budget', file_format, user))), self.expected(user))
+
+    def test_streams_in_chunks(self):
+        self.client.force_login(self.user)
+        with mock.patch.object(exporters, 'CHUNK_SIZE', 3):
+            for file_format in FORMATS:
+                with self.subTest(file_format=file_format):
+                    response = self.client.get(reverse('export_data', args=['budget', file_format]))
+                    self.assertTrue(response.streaming)
+                    self.assertEqual(response['Content-Disposition'], f'attachment; filename="budget.{FORMATS[file_format][1]}"')
+                    chunks = list(response.streaming_content)
+                    content = [chunk.decode() for chunk in chunks] if file_format != 'parquet' else chunks
+                    self.assertEqual(self.read(file_format, content), self.expected(self.user))
+                    if file_format == 'parquet':
+                        # A row group per chunk, each flushed as it's written
+                        self.assertEqual(pq.ParquetFile(io.BytesIO(b''.join(chunks))).metadata.num_row_groups, 3)
+                        self.assertGreater(len([chunk for chunk in chunks if chunk]), 1)
+                    else:
+                        self.assertGreater(len(chunks), 1)
@@ -0,0 +1,106 @@
+import datetime
+import json
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+
+from .benchmarks import invalidate_benchmark
+from .models import CAP_ATTRS, Fund, RegionAllocation, SectorAllocation
+from .search import funds_changed
+from .snapshots import mark_dirty
+from .versions import bump_fund_holders
+
+CHUNK_SIZE = 500
+FUND_FIELDS = ['name', 'isin', 'nav', 'domestic', 'international', *CAP_ATTRS]
+
+
+def read_funds(stream):
+    """
+    Fund records from a dump: JSON lines (one fund per line, streamed) or a single
+    JSON array. Each record has a ticker, optional name/isin/nav/as_of, the
+    domestic/international and cap-style percentages, and {label: percentage}
+    maps under "regions" and "sectors".
+    """
+    first = stream.read(1)
+    while first.isspace():
+        first = stream.read(1)
+    if first == '[':
+        yield from json.loads(first + stream.read())
+        return
+    for line in (first + stream.readline(), *stream):
+        if line.strip():
+            yield json.loads(line)
+
+
+def _fund(record, today):
+    """The Fund for ``record``, with only the fields the record provides set; last_updated comes with a nav."""
+    values = {field: record[field] for field in FUND_FIELDS if field in record}
+    if 'nav' in values:
+        if values['nav'] is not None:
+            values['nav'] = Decimal(str(values['nav']))
+        values['last_updated'] = datetime.date.fromisoformat(record['as_of']) if record.get('as_of') else today
+    return Fund(ticker=record['ticker'].upper(), **values), frozenset(values)
+
+
+def _upsert_funds(funds):
+    """
+    Upsert ``funds``, a list of (Fund, fields it provides), overwriting only those
+    fields on existing funds: one bulk_create per distinct field set, so a record
+    that leaves out a field keeps the stored value instead of the default.
+    """
+    by_fields = defaultdict(list)
+    for fund, fields in funds:
+        by_fields[fields].append(fund)
+    for fields, group in by_fields.items():
+        if fields:
+            Fund.objects.bulk_create(group, update_conflicts=True, unique_fields=['ticker'], update_fields=sorted(fields))
+        else:
+            Fund.objects.bulk_create(group, ignore_conflicts=True)
+
+
+def _upsert_allocations(model, label, records, fund_ids):
+    # Only records that carry this breakdown replace it; the rest keep what's stored
+    records = [record for record in records if label + 's' in record]
+    fund_ids = {record['ticker'].upper(): fund_ids[record['ticker'].upper()] for record in records}
+    rows = [
+        model(fund_id=fund_ids[record['ticker'].upper()], **{label: name}, percentage=Decimal(str(pct)))
+        for record in records for name, pct in (record[label + 's'] or {}).items()
+    ]
+    model.objects.bulk_create(rows, update_conflicts=True, unique_fields=['fund', label], update_fields=['percentage'])
+
+    # Drop labels a fund no longer reports so its breakdown matches the dump
+    keep = {(row.fund_id, getattr(row, label)) for row in rows}
+    stale = [
+        pk for pk, fund_id, name in model.objects.filter(fund_id__in=fund_ids.values()).values_list('pk', 'fund_id', label)
+        if (fund_id, name) not in keep
+    ]
+    model.objects.filter(pk__in=stale).delete()
+    return len(rows)
+
+
+def ingest_funds(records, chunk_size=CHUNK_SIZE):
+    """
+    Upsert funds and their sector/region allocations from ``records``, one
+    transaction per chunk. Fields and breakdowns a record leaves out are kept
+    as stored, so a partial dump (say, allocations only) can be re-ingested.
+    Yields (funds, allocations) counts after each chunk so callers can report
+    progress.
+    """
+    today = datetime.date.today()
+    records = iter(records)
+    while chunk := list(islice(records, chunk_size)):
+        funds = [_fund(record, today) for record in chunk]
+        with transaction.atomic():
+            _upsert_funds(funds)
+            fund_ids = dict(Fund.objects.filter(ticker__in=[f.ticker for f, _ in funds]).values_list('ticker', 'id'))
+            allocations = _upsert_allocations(SectorAllocation, 'sector', chunk, fund_ids)
+            allocations += _upsert_allocations(RegionAllocation, 'region', chunk, fund_ids)
+            # bulk_create skips post_save, so do what the signal handlers would
+            mark_dirty(fund_ids=fund_ids.values())
+            bump_fund_holders(fund_ids.values())
+            funds_changed(Fund.objects.filter(id__in=fund_ids.values()).only('id', 'ticker', 'name', 'isin'))
+        for ticker in fund_ids:
+            invalidate_benchmark(ticker)
+        yield len(funds), allocations
@@ -11,9 +11,18 @@ urlpatterns = [
     path('logout/', views.user_logout, name='logout'),
     path('portfolio/', views.portfolio, name='portfolio'),
     path('delete-holding/<int:pk>/', views.delete_holding, name='delete_holding'),
+    path('portfolio/holdings/batch/', views.batch_holdings, name='batch_holdings'),
+    path('funds/search/', views.fund_search, name='fund_search'),
+    path('portfolio/live/', views.portfolio_live, name='portfolio_live'),
+    path('portfolio/performance/', views.portfolio_performance, name='portfolio_performance'),
+    path('portfolio/projection/', views.projection, name='projection'),
+    path('portfolio/rebalance/', views.rebalance, name='rebalance'),
     path('portfolio/update_nav/<int:holding_id>/', views.update_nav, name='update_nav'),
     path('budget/', views.budget, name='budget'),
     path('budget/<int:year>', views.budget, name='budget'),
+    path('budget/import/', views.import_expenses, name='import_expenses'),
+    path('export/<str:kind>/<str:file_format>/', views.export_data, name='export_data'),
+    path('metrics/', views.metrics, name='metrics'),
     path('set_income/', views.set_income, name='set_income'),
     path('delete_expense/<int:pk>/', views.delete_expense, name='delete_expense')
 ]
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+Per-user version stamps for the portfolio and budget pages, kept in the Django
+cache and bumped (after commit) whenever something a page shows is written.
+They drive the pages' ETag/Last-Modified headers and key their cached template
+fragments, so a stale fragment is never served, only left to expire. With more
+than one worker process the cache backend must be shared (Redis, Memcached),
+or a worker can miss another's bump until settings.FINANCEAPP_FRAGMENT_TTL.
+"""
+import datetime
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Portfolio
+
+PORTFOLIO, BUDGET = 'portfolio', 'budget'
+# Benchmark breakdowns appear on everyone's portfolio page, so they get one global stamp
+BENCHMARKS = 'benchmarks'
+DEFAULT_FRAGMENT_TTL = 60 * 60
+
+
+def _key(scope, user_id):
+    return f'financeapp:version:{scope}:{user_id}'
+
+
+def bump(scope, user_ids):
+    """Give ``user_ids`` a new ``scope`` stamp once the current transaction commits."""
+    keys = [_key(scope, user_id) for user_id in set(user_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.set_many({key: time.time_ns() for key in keys}, timeout=None))
+
+
+def bump_portfolios(portfolio_ids, scopes=(PORTFOLIO,)):
+    user_ids = list(Portfolio.objects.filter(id__in=portfolio_ids).values_list('user_id', flat=True))
+    for scope in scopes:
+        bump(scope, user_ids)
+
+
+def bump_fund_holders(fund_ids):
+    """New portfolio stamps for everyone holding one of ``fund_ids``."""
+    bump(PORTFOLIO, Portfolio.objects.filter(holdings__fund_id__in=fund_ids).values_list('user_id', flat=True).distinct())
+
+
+def bump_benchmarks():
+    bump(BENCHMARKS, [0])
+
+
+def _stamps(keys):
+    stamps = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in stamps}
+    if missing:
+        # Cold or evicted: start a new version now, which at worst costs one re-render
+        for key, stamp in missing.items():
+            cache.add(key, stamp, timeout=None)
+        stamps.update(cache.get_many(list(missing)))
+    return [stamps.get(key, missing.get(key)) for key in keys]
+
+
+def page_stamp(request, scope):
+    """Latest change (ns since the epoch) to anything on ``request.user``'s ``scope`` page."""
+    keys = [_key(scope, request.user.id)]
+    if scope == PORTFOLIO:
+        keys.append(_key(BENCHMARKS, 0))
+    stamp = max(_stamps(keys))
+    if scope == PORTFOLIO:
+        # The page shows how many days old prices are, which changes at midnight
+        midnight = timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time()))
+        stamp = max(stamp, int(midnight.timestamp() * 1e9))
+    if scope == BUDGET:
+        # The page defaults to (and lists) the current year, which changes on January 1
+        new_year = timezone.make_aware(datetime.datetime(timezone.localdate().year, 1, 1))
+        stamp = max(stamp, int(new_year.timestamp() * 1e9))
+    return stamp
+
+
+def page_version(request, scope):
+    """
+    Opaque version of the page: its stamp plus the user and CSRF secret, since
+    the cached markup includes forms with CSRF tokens.
+    """
+    parts = [scope, request.user.id, page_stamp(request, scope), request.META.get('CSRF_COOKIE', '')]
+    return hashlib.sha1(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def page_etag(scope):
+    """``etag_func`` for ``django.views.decorators.http.condition``."""
+    def etag(request, *args, **kwargs):
+        # Pending flash messages are part of the response, so never answer 304 over them
+        if not request.user.is_authenticated or len(messages.get_messages(request)):
+            return None
+        return page_version(request, scope)
+    return etag
+
+
+def page_last_modified(scope):
+    """``last_modified_func`` for ``django.views.decorators.http.condition``."""
+    def last_modified(request, *args, **kwargs):
+        if not request.user.is_authenticated or len(messages.get_messages(request)):
+            return None
+        return datetime.datetime.fromtimestamp(page_stamp(request, scope) / 1e9, tz=datetime.timezone.utc)
+    return last_modified
+
+
+def fragment_ttl():
+    return getattr(settings, 'FINANCEAPP_FRAGMENT_TTL', DEFAULT_FRAGMENT_TTL)
+
+
+def lazy_context(func, keys):
+    """
+    Template context entries backed by one call to ``func`` (returning a dict),
+    made only if a template renders one of them, so a cached fragment skips
+    the queries behind it.
+    """
+    result = functools.cache(func)
+    return {key: functools.partial(lambda key: result()[key], key) for key in keys}
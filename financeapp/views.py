@@ -1,17 +1,39 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login, authenticate, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .models import Portfolio, Holding
-from .forms import HoldingForm, BudgetForm
-import mstarpy
-from datetime import datetime, timedelta
-from .util import *
-import yfinance as yf
-from decimal import Decimal
-from collections import defaultdict
-import calendar
+from .models import Portfolio, Holding, BudgetItem, Fund
+from .forms import HoldingForm, BudgetForm, BudgetImportForm
+from .importers import import_budget_items, reader_for
+from .exporters import EXPORTS, FORMATS, export_stream
+from .snapshots import get_snapshot
+from .holdings import add_holding, add_holdings, purchase_shares
+from .benchmarks import benchmark_tickers, get_benchmarks
+from .budgeting import year_budget
+from .providers import get_provider
+from .metrics import export_registry, timed
+from .resilience import MarketDataUnavailable, lookup_fund
+from .search import DEFAULT_LIMIT, fund_index
+from .versions import BUDGET, PORTFOLIO, fragment_ttl, lazy_context, page_etag, page_last_modified, page_version
+import datetime
+from django.utils import timezone
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.views.decorators.http import condition
+from asgiref.sync import sync_to_async
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import csv
+import io
+import json
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+# What a purchase can fail with short of a bug: an unknown symbol, a fund without
+# a NAV for a dollar amount, or market data being unavailable
+PURCHASE_ERRORS = (LookupError, ObjectDoesNotExist, ValueError, MarketDataUnavailable)
 
 # Create your views here.
 def index(request):
@@ -48,6 +70,7 @@ def user_logout(request):
     return redirect('index')
 
 @login_required
+@condition(etag_func=page_etag(PORTFOLIO), last_modified_func=page_last_modified(PORTFOLIO))
 def portfolio(request):
     portfolio, created = Portfolio.objects.get_or_create(
         user=request.user,
@@ -59,52 +82,106 @@ def portfolio(request):
         if form.is_valid():
             data = form.cleaned_data
             try:
-                fund = getFund(data.get('symbol'))
-                holding, _ = Holding.objects.get_or_create(portfolio=portfolio, fund=fund)
-                holding.shares += data.get('shares') or Decimal(data['dollars_invested'])/Decimal(fund.nav)
-                holding.save()
+                # Funds already in the database (e.g. from ingest_funds) never wait on market data
+                fund = Fund.objects.filter(ticker=data['symbol'].upper()).first()
+                if fund is None:
+                    fund = lookup_fund(data['symbol'])
+                add_holding(portfolio, fund, purchase_shares(fund, data.get('shares'), data.get('dollars_invested')))
 
                 messages.success(request, 'Holding added successfully.')
-            except Exception as e:
-                print(e)
-                messages.error(request, f'Error adding holding: {str(e)}. Please check the fund symbol and try again.')
+            except PURCHASE_ERRORS as e:
+                logger.exception('Adding %s to portfolio %s failed', data['symbol'], portfolio.id)
+                suggestions = ', '.join(f['ticker'] for f in fund_index.search(data['symbol'], limit=3) if f['ticker'].upper() != data['symbol'].upper())
+                hint = f' Did you mean {suggestions}?' if suggestions else ''
+                messages.error(request, f'Error adding holding: {str(e)}. Please check the fund symbol and try again.{hint}')
             
             return redirect('portfolio')
     else:
         form = HoldingForm()
 
-    updateFunds(request.user)
+    # NAVs are kept current by the refresh_navs command, so this page only reads the database.
+    return render_portfolio(request, portfolio, form)
+
+@login_required
+async def portfolio_live(request):
+    """
+    Async portfolio page for ASGI deployments: re-prices the user's stale funds
+    concurrently (giving up after FINANCEAPP_LIVE_REFRESH_TIMEOUT and keeping the
+    last known NAVs) before rendering, without tying up a worker thread while
+    the market-data provider is slow.
+    """
+    from .refresh import arefresh_funds, stale_funds  # pulls in NumPy via the price history store
+
+    user = await request.auser()
+    portfolio, _ = await Portfolio.objects.aget_or_create(user=user, defaults={'name': f"{user.username}'s Portfolio"})
+    stale = [fund async for fund in stale_funds().filter(holding__portfolio=portfolio)]
+    if stale:
+        timeout = getattr(settings, 'FINANCEAPP_LIVE_REFRESH_TIMEOUT', 3)
+        await arefresh_funds(get_provider(), stale, timeout=timeout)
+    return await sync_to_async(render_portfolio)(request, portfolio, HoldingForm())
 
-    holdings = portfolio.holdings.all()
-    total_dollars = sum((h.shares or 0) * (h.fund.nav or 0) for h in holdings)
-    vt, vxus = getFund('VT'), getFund('VXUS')
+def render_portfolio(request, portfolio, form):
+    # Everything below the form is built lazily, so a cached fragment (keyed on
+    # the page version) skips these queries altogether
+    context = lazy_context(lambda: portfolio_tables(portfolio), [
+        'holdings', 'regions', 'total_regions', 'intl_regions', 'total_intl_regions', 'allocs', 'total_allocs',
+        'sectors', 'total_sectors', 'total_invested', 'prices_as_of', 'price_age',
+    ])
+    context.update({'portfolio': portfolio, 'form': form, 'page_version': page_version(request, PORTFOLIO), 'fragment_ttl': fragment_ttl()})
+    with timed('render'):
+        return render(request, 'portfolio.html', context)
 
-    regions = defaultdict(lambda: Decimal(0))
-    intl_alloc = defaultdict(lambda: Decimal(0))
-    allocs = defaultdict(lambda: Decimal(0))
-    sectors = defaultdict(lambda: Decimal(0))
-    total_invested = 0
-    total_invested = sum(round(holding.fund.nav*holding.shares, 2) for holding in holdings)
+def portfolio_tables(portfolio):
+    holdings = portfolio.holdings.select_related('fund')
+    prices_as_of = min((h.fund.last_updated for h in holdings), default=None)
+    benchmarks = benchmark_tickers()
+    breakdowns = get_benchmarks([benchmarks['total'], benchmarks['international']])
+    total, intl = breakdowns[benchmarks['total'].upper()], breakdowns[benchmarks['international'].upper()]
+
+    # Exposures come precomputed from the portfolio's snapshot (see snapshots.py).
+    snapshot = get_snapshot(portfolio)
+    exposures = snapshot.exposures()
+    regions, intl_regions, allocs, sectors = exposures['regions'], exposures['intl_regions'], exposures['allocs'], exposures['sectors']
+    total_invested = snapshot.total_value
     for holding in holdings:
-        for region in holding.fund.region_allocations.all():
-            regions[region.region] += region.percentage*holding.fund.nav*holding.shares
-        for allocAttr in CAP_ATTRS:
-            allocs[allocAttr] += getattr(holding.fund, allocAttr)*holding.fund.nav*holding.shares
-        for sector in holding.fund.sector_allocations.all():
-            sectors[sector.sector] += sector.percentage*holding.fund.nav*holding.shares
-        dollars_invested = round(holding.fund.nav*holding.shares, 2)
+        # Funds ingested without a NAV count as nothing until they're priced, as in the snapshot
+        dollars_invested = round((holding.fund.nav or 0)*holding.shares, 2)
         holding.dollars_invested = f'{dollars_invested:,}'
-        holding.percent = round(dollars_invested/total_invested*100, 2)
-    regions = {r: round(p/Decimal(total_dollars), 2) for r, p in regions.items()}
-    total_regions = [vt.region_allocations.get(region=region).percentage for region in regions]
-    intl_regions = {r: round(p/(100-regions['United States'])*100, 2) for r, p in regions.items() if r != 'United States'}
-    intl_total_regions = [vxus.region_allocations.get(region=region).percentage for region in intl_regions]
-    allocs = {alloc.replace('_', ' ').replace('cap ', '').title(): round(p/Decimal(total_dollars), 2) for alloc, p in allocs.items()}
-    total_allocs = [getattr(vt, allocAttr) for allocAttr in CAP_ATTRS]
-    sectors = {s: round(p/Decimal(total_dollars), 2) for s, p in sectors.items()}
-    total_sectors = [vt.sector_allocations.get(sector=sector).percentage for sector in sectors]
-
-    return render(request, 'portfolio.html', {'portfolio': portfolio, 'form': form, 'holdings': holdings, 'regions': regions, 'total_regions': total_regions, 'intl_regions': intl_regions, 'total_intl_regions': intl_total_regions, 'allocs': allocs, 'total_allocs': total_allocs, 'sectors': sectors, 'total_sectors': total_sectors, 'total_invested': f'{total_invested:,}'})
+        holding.percent = round(dollars_invested/total_invested*100, 2) if total_invested else 0
+    total_regions = [total['regions'].get(region, 0) for region in regions]
+    intl_total_regions = [intl['regions'].get(region, 0) for region in intl_regions]
+    total_allocs = total['caps']
+    total_sectors = [total['sectors'].get(sector, 0) for sector in sectors]
+
+    return {'holdings': holdings, 'regions': regions, 'total_regions': total_regions, 'intl_regions': intl_regions, 'total_intl_regions': intl_total_regions, 'allocs': allocs, 'total_allocs': total_allocs, 'sectors': sectors, 'total_sectors': total_sectors, 'total_invested': f'{total_invested:,}', 'prices_as_of': prices_as_of, 'price_age': (timezone.localdate() - prices_as_of).days if prices_as_of else None}
+
+@login_required
+def batch_holdings(request):
+    """
+    POST {"purchases": [{"symbol": "VTI", "shares": 2}, {"symbol": "VXUS", "dollars_invested": 500}, ...]}
+    and every purchase is applied in one transaction.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST a JSON body of purchases.'}, status=405)
+    try:
+        items = json.loads(request.body)['purchases']
+    except (ValueError, KeyError, TypeError):
+        items = None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return JsonResponse({'error': 'Expected a JSON object with a "purchases" list of objects.'}, status=400)
+    purchases = []
+    for number, item in enumerate(items, 1):
+        form = HoldingForm(item)
+        if not form.is_valid():
+            return JsonResponse({'error': f'Purchase {number}: invalid', 'fields': form.errors}, status=400)
+        purchases.append((form.cleaned_data['symbol'], form.cleaned_data.get('shares'), form.cleaned_data.get('dollars_invested')))
+    portfolio, _ = Portfolio.objects.get_or_create(user=request.user, defaults={'name': f"{request.user.username}'s Portfolio"})
+    try:
+        applied = add_holdings(portfolio, purchases)
+    except PURCHASE_ERRORS as e:
+        logger.exception('Batch of %d purchases for portfolio %s failed', len(purchases), portfolio.id)
+        return JsonResponse({'error': f'Error adding holdings: {e}. Nothing was applied.'}, status=400)
+    return JsonResponse({'applied': applied})
 
 @login_required
 def delete_holding(request, pk):
@@ -130,10 +207,10 @@ def update_nav(request, holding_id):
     return redirect('portfolio')
 
 @login_required
+@condition(etag_func=page_etag(BUDGET), last_modified_func=page_last_modified(BUDGET))
 def budget(request, year=None):
     # budget = MonthlyBudget(user=request.user)
-    year = year or datetime.datetime.today().year
-    print(year)
+    year = year or timezone.localdate().year
     if request.method == 'POST':
         form = BudgetForm(request.POST)
         if form.is_valid():
@@ -150,37 +227,21 @@ def budget(request, year=None):
     else:
         form = BudgetForm()
     
-    items = BudgetItem.objects.filter(user=request.user)
-    monthlyBudgets = {calendar.month_name[month]: MonthlyBudget(request.user, month, year) for month in sorted(set(item.date.month for item in items.filter(date__year=year)) - {'Recurring'})}
-
-    # all_month_expenses = {month: budget.expenses.to_html(classes='table table-striped', index=False) for month, budget in monthlyBudgets.items()}
-    months = {month: {
-        'expenses': budget.expenses.to_dict(orient="records"),
-        'total_spent': round(budget.totalExpenses(), 2),
-        'total_needs': round(budget.totalNeeds(), 2),
-        'total_wants': round(budget.totalWants(), 2),
-        'savings': round(budget.savings(), 2),
-        } for month, budget in monthlyBudgets.items()}
-    # wants_table = budget.wants().to_html(classes='table table-striped', index=False)
-    # needs_table = budget.needs().to_html(classes='table table-striped', index=False)
-    
-    context = {
+    income = request.user.portfolio.monthly_income
+    # The summary tables only query when their cached fragment is missing
+    context = lazy_context(lambda: year_budget(request.user, year, income), ['months', 'needs_summary', 'wants_summary', 'savings'])
+    context.update({
         'form': form,
-        'income': request.user.portfolio.monthly_income,
-        'all_months': months,
-        'needs_summary': getBudgetAverages(monthlyBudgets.values(), 'Needs').to_html(classes='table table-striped', index=False),
-        'wants_summary': getBudgetAverages(monthlyBudgets.values(), 'Wants').to_html(classes='table table-striped', index=False),
-        'savings': round(sum(m['savings'] for m in months.values())/len(months) if months else 0, 2),
+        'import_form': BudgetImportForm(),
+        'income': income,
         'year': year,
-        'avail_years': sorted({datetime.datetime.today().year}|{item.date.year for item in items}, reverse=True),
-        # 'total_wants': budget.totalWants(),
-        # 'total_needs': budget.totalNeeds(),
-        # 'expenses_table': expenses_table,
-        # 'wants_table': wants_table,
-        # 'needs_table': needs_table
-    }
+        'avail_years': sorted({timezone.localdate().year}|{d.year for d in BudgetItem.objects.filter(user=request.user).dates('date', 'year')}, reverse=True),
+        'page_version': page_version(request, BUDGET),
+        'fragment_ttl': fragment_ttl(),
+    })
     # print(request.user)
-    return render(request, 'budget.html', context)
+    with timed('render'):
+        return render(request, 'budget.html', context)
 
 def set_income(request):
     if request.method == 'POST':
@@ -197,4 +258,126 @@ def delete_expense(request, pk):
             messages.success(request, 'Holding removed successfully.')
         else:
             messages.error(request, 'You do not have permission to remove this holding.')
-    return redirect('budget')
\ No newline at end of file
+    return redirect('budget')
+
+@login_required
+def import_expenses(request):
+    if request.method == 'POST':
+        form = BudgetImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                reader = reader_for(upload.name, form.cleaned_data['file_format'])
+                stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+                result = import_budget_items(request.user, reader(stream, category=form.cleaned_data['category']))
+                messages.success(request, f'Imported {result.created} expenses ({result.duplicates} duplicates skipped).')
+                for number, error in result.errors[:10]:
+                    messages.error(request, f'Row {number}: {error}')
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                messages.error(request, f'Error importing expenses: {e}')
+        else:
+            messages.error(request, 'Error importing expenses. Please check the form.')
+    return redirect('budget')
+
+@login_required
+def export_data(request, kind, file_format):
+    if kind not in EXPORTS or file_format not in FORMATS:
+        raise Http404
+    # ?all=1 exports every user's data, staff only
+    export_all = request.GET.get('all') == '1'
+    if export_all and not request.user.is_staff:
+        raise Http404
+    content_type, extension = FORMATS[file_format]
+    response = StreamingHttpResponse(export_stream(kind, file_format, None if export_all else request.user), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{extension}"'
+    return response
+
+@login_required
+def portfolio_performance(request):
+    from .performance import portfolio_performance as performance  # NumPy loads on first use
+
+    try:
+        start, end = (datetime.date.fromisoformat(request.GET[k]) if request.GET.get(k) else None for k in ('start', 'end'))
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates.'}, status=400)
+    holdings = Holding.objects.filter(portfolio__user=request.user)
+    result = performance(holdings, start, end, benchmark=benchmark_tickers()['total'])
+    if result is None:
+        return JsonResponse({'error': 'Not enough price history for this portfolio yet.'}, status=404)
+    return JsonResponse(result)
+
+@login_required
+def rebalance(request):
+    """
+    Trades toward the total-market benchmark's exposures. Query parameters: cash
+    (new money), sell=1 to allow selling, add=VTI,BND for extra candidate funds,
+    universe=1 to consider every priced fund, max_trades.
+    """
+    from .rebalance import MAX_TRADES, rebalance_portfolio  # SciPy/NumPy load on first use
+
+    try:
+        cash = float(request.GET.get('cash') or 0)
+        max_trades = int(request.GET.get('max_trades') or MAX_TRADES)
+    except ValueError:
+        return JsonResponse({'error': 'cash and max_trades must be numbers.'}, status=400)
+    if not math.isfinite(cash) or cash < 0:
+        return JsonResponse({'error': 'cash must be a finite amount, not negative.'}, status=400)
+    if max_trades < 1:
+        return JsonResponse({'error': 'max_trades must be at least 1.'}, status=400)
+    portfolio, _ = Portfolio.objects.get_or_create(user=request.user, defaults={'name': f"{request.user.username}'s Portfolio"})
+    candidates = [t for t in request.GET.get('add', '').split(',') if t.strip()]
+    return JsonResponse(rebalance_portfolio(
+        portfolio, cash=cash, allow_sell=request.GET.get('sell') == '1', candidates=[t.strip() for t in candidates],
+        universe=request.GET.get('universe') == '1', max_trades=max_trades,
+    ))
+
+@login_required
+def projection(request):
+    """
+    Monte Carlo projection of the portfolio as JSON percentile bands. Query
+    parameters: years, paths, seed, goal, and contribution (defaults to the
+    budget's average monthly savings).
+    """
+    from .projection import MAX_PATHS, MAX_YEARS, monthly_savings, project  # NumPy loads on first use
+
+    try:
+        years = int(request.GET.get('years') or 30)
+        paths = int(request.GET.get('paths') or 10_000)
+        seed = int(request.GET['seed']) if request.GET.get('seed') else None
+        goal = float(request.GET['goal']) if request.GET.get('goal') else None
+        contribution = float(request.GET['contribution']) if request.GET.get('contribution') else None
+    except ValueError:
+        return JsonResponse({'error': 'years, paths, seed, goal and contribution must be numbers.'}, status=400)
+    if not all(math.isfinite(v) for v in (goal, contribution) if v is not None):
+        return JsonResponse({'error': 'goal and contribution must be finite.'}, status=400)
+    if not (1 <= years <= MAX_YEARS and 1 <= paths <= MAX_PATHS):
+        return JsonResponse({'error': f'years must be 1-{MAX_YEARS} and paths 1-{MAX_PATHS}.'}, status=400)
+    if seed is not None and seed < 0:
+        return JsonResponse({'error': 'seed must not be negative.'}, status=400)
+    portfolio, _ = Portfolio.objects.get_or_create(user=request.user, defaults={'name': f"{request.user.username}'s Portfolio"})
+    if contribution is None:
+        contribution = monthly_savings(portfolio)
+    holdings = portfolio.holdings.select_related('fund')
+    result = project(holdings, contribution, years=years, paths=paths, seed=seed, goal=goal)
+    if result is None:
+        return JsonResponse({'error': 'Add holdings or savings to project.'}, status=404)
+    return JsonResponse(result)
+
+@login_required
+def fund_search(request):
+    """Autocomplete: funds whose ticker, ISIN or name starts with ?q=, as JSON."""
+    try:
+        limit = min(int(request.GET.get('limit') or DEFAULT_LIMIT), 50)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number.'}, status=400)
+    return JsonResponse({'results': fund_index.search(request.GET.get('q', ''), limit=limit)})
+
+def metrics(request):
+    token = getattr(settings, 'FINANCEAPP_METRICS_TOKEN', None)
+    if token:
+        allowed = request.headers.get('Authorization') == f'Bearer {token}'
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        raise Http404
+    return HttpResponse(generate_latest(export_registry()), content_type=CONTENT_TYPE_LATEST)
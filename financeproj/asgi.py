@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'financeproj.settings')
 
 application = get_asgi_application()
+
+from financeapp.search import warm_index  # noqa: E402 (needs the apps loaded above)
+
+warm_index()